@@ -0,0 +1,69 @@
+import pandas as pd
+from shift_record import ShiftRecord, build_assignment_table
+
+
+class StoreAssignmentIndex:
+    """(日付, 店舗) から、その店舗にヘルプに入る従業員と時間を引く逆引きインデックス
+
+    期間のシフトから一度だけ作成し、以降はセルが変わるたびに update() で
+    その従業員・日付の分だけを差し替える。
+    """
+
+    def __init__(self):
+        # 日付 -> 店舗 -> {従業員: [(時間, 開始分, 終了分), ...]}
+        self._by_date = {}
+        # (日付, 従業員) -> その従業員が入っている店舗の集合（差し替え時の削除用）
+        self._by_cell = {}
+
+    @classmethod
+    def from_shift_data(cls, shift_data):
+        """日付×従業員のシフトからインデックスを作成する"""
+        index = cls()
+        table = build_assignment_table(shift_data)
+        table = table[table['store'].notna() & (table['store'] != '')]
+        start_mins = table['start_min'].astype(object).where(table['start_min'].notna(), None)
+        end_mins = table['end_min'].astype(object).where(table['end_min'].notna(), None)
+        for date, store, employee, time, start_min, end_min in zip(
+            table['date'], table['store'], table['employee'], table['time_text'], start_mins, end_mins
+        ):
+            index._by_date.setdefault(date, {}).setdefault(store, {}).setdefault(employee, []).append((time, start_min, end_min))
+            index._by_cell.setdefault((date, employee), set()).add(store)
+        return index
+
+    def update(self, date, employee, shift):
+        """従業員のその日のシフトが変わったときに、インデックスの該当部分を差し替える"""
+        date = pd.Timestamp(date)
+        stores = self._by_date.setdefault(date, {})
+        for store in self._by_cell.pop((date, employee), ()):
+            assignments = stores.get(store)
+            if assignments is not None:
+                assignments.pop(employee, None)
+                if not assignments:
+                    del stores[store]
+
+        for segment in ShiftRecord.of(shift).segments:
+            if segment.store:
+                stores.setdefault(segment.store, {}).setdefault(employee, []).append(
+                    (segment.time, segment.start_min, segment.end_min)
+                )
+                self._by_cell.setdefault((date, employee), set()).add(segment.store)
+
+    def assignments(self, date, store):
+        """その日その店舗に入る {従業員: [(時間, 開始分, 終了分), ...]} を返す"""
+        return self._by_date.get(pd.Timestamp(date), {}).get(store, {})
+
+    def iter_segments(self, dates):
+        """指定した日付の (日付, 店舗, 開始分, 終了分) をすべて返す（時間を解析できない側はNone）"""
+        for date in dates:
+            for store, assignments in self._by_date.get(date, {}).items():
+                for segments in assignments.values():
+                    for _, start_min, end_min in segments:
+                        yield date, store, start_min, end_min
+
+    def filled_stores(self, date):
+        """その日ヘルプが埋まっている店舗の集合（キーのビュー）を返す"""
+        return self._by_date.get(pd.Timestamp(date), {}).keys()
+
+    def is_filled(self, date, store):
+        """その日その店舗のヘルプが埋まっているかどうか"""
+        return store in self.filled_stores(date)
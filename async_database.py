@@ -0,0 +1,47 @@
+import asyncio
+import threading
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from database import get_db
+
+
+class AsyncDBAdapter:
+    """同期バックエンドを非同期インターフェースで包むアダプタ
+
+    呼び出しはワーカースレッドで実行する。Supabaseでもプロセスで共有するクライアント
+    （keep-aliveのHTTP接続と、ページを並行して取得するスレッドプール）をそのまま使うため、
+    リランごとに接続を作り直さない。
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    async def _to_thread(func, *args):
+        # st.errorなどを別スレッドから使うため、スクリプトの実行コンテキストを引き継ぐ
+        ctx = get_script_run_ctx()
+
+        def run():
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+            return func(*args)
+
+        return await asyncio.to_thread(run)
+
+    async def get_shifts(self, start_date, end_date):
+        return await self._to_thread(self.db.get_shifts, start_date, end_date)
+
+    async def get_store_help_requests(self, start_date, end_date):
+        return await self._to_thread(self.db.get_store_help_requests, start_date, end_date)
+
+    async def get_period(self, start_date, end_date):
+        return tuple(await asyncio.gather(
+            self.get_shifts(start_date, end_date),
+            self.get_store_help_requests(start_date, end_date)
+        ))
+
+
+@st.cache_resource
+def get_async_db():
+    """設定中のバックエンドに対応する非同期データアクセス層を返す"""
+    return AsyncDBAdapter(get_db())
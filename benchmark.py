@@ -0,0 +1,474 @@
+"""パフォーマンス計測用スクリプト
+
+使い方:
+    python benchmark.py startup
+    python benchmark.py parse
+    python benchmark.py assignments
+    python benchmark.py counts
+    python benchmark.py merge
+    python benchmark.py conflicts
+    python benchmark.py gaps
+    python benchmark.py solver
+    python benchmark.py table
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _timeit(func, repeat=5):
+    """funcをrepeat回実行し、最小の実行時間（秒）と最後の戻り値を返す"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# bench_startupで比べるコミット（データベースのクライアントを遅延作成にする前と後）
+STARTUP_BEFORE = '4cabad1^'
+STARTUP_AFTER = '4cabad1'
+
+# 1つのプロセスでの計測（作業ディレクトリのmain.pyとdatabase.pyを使う）
+# main.pyは `if __name__ == '__main__'` の外ではStreamlitの描画を行わないため、
+# run_nameを変えて読み込めばモジュールレベルの処理だけを計測できる
+_STARTUP_SCRIPT = """
+import importlib, json, runpy, sys, time
+sys.path.insert(0, '.')
+repeat = int(sys.argv[1])
+
+def best(func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def rerun():
+    runpy.run_path('main.py', run_name='bench')['db'].init_db
+
+start = time.perf_counter()
+rerun()
+cold = time.perf_counter() - start
+warm = best(rerun)
+import database
+reload = best(lambda: importlib.reload(database))
+print(json.dumps({'cold': cold, 'warm': warm, 'reload': reload}))
+"""
+
+
+def _export_tree(revision, directory):
+    """gitのリビジョンのファイル一式をdirectoryに書き出す（書き出せなければFalse）"""
+    archive = subprocess.run(['git', 'archive', revision], cwd=HERE, capture_output=True)
+    if archive.returncode != 0:
+        return False
+    subprocess.run(['tar', '-x', '-C', directory], input=archive.stdout, check=True)
+    return True
+
+
+def _measure_startup(tree, env, repeat):
+    """treeのmain.pyを新しいプロセスでrepeat回起動し、各計測の最小値（秒）を返す"""
+    results = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-c', _STARTUP_SCRIPT, str(repeat)], cwd=tree, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            # 失敗した場合は最後の行（例外のメッセージ）を返す
+            lines = result.stderr.strip().splitlines()
+            return lines[-1] if lines else f'終了コード {result.returncode}'
+        results.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {name: min(result[name] for result in results) for name in results[0]}
+
+
+def _imports_without_credentials(tree, env):
+    """Supabaseの認証情報がない環境でdatabase.pyをインポートできるかどうか"""
+    env = {key: value for key, value in env.items() if key not in ('SUPABASE_URL', 'SUPABASE_KEY')}
+    env['DB_BACKEND'] = 'supabase'
+    result = subprocess.run([sys.executable, '-c', 'import database'], cwd=tree, env=env, capture_output=True, text=True)
+    if result.returncode == 0:
+        return '成功'
+    lines = result.stderr.strip().splitlines()
+    return f"失敗（{lines[-1] if lines else result.returncode}）"
+
+
+def bench_startup(repeat=5):
+    """データベースのクライアントを遅延作成にする前と後で、起動にかかる時間を比べる
+
+    変更前（STARTUP_BEFORE）・変更後（STARTUP_AFTER）のコミットと現在の作業ディレクトリの
+    それぞれで、新しいプロセスから次を計測する。
+    - コールド: main.pyを読み込み、最初にdbへアクセスするまで
+    - ウォーム: 同じプロセスでmain.pyを再実行し（Streamlitのリランに相当）、dbへアクセスするまで
+    - 読み込み直し: database.pyをimportlib.reloadしたとき
+    - 認証情報なし: Supabaseの認証情報がない環境でdatabase.pyをインポートできるか
+
+    バックエンドが設定されていなければ、一時ファイルのSQLiteで計測する
+    （Supabaseのクライアントを作成する時間を含めるには DB_BACKEND=supabase と認証情報を設定する）。
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        env.setdefault('DB_BACKEND', 'sqlite')
+        env.setdefault('SQLITE_PATH', os.path.join(workdir, 'startup.db'))
+        print(f"バックエンド: {env['DB_BACKEND']}（{repeat}回中の最小）")
+
+        trees = []
+        for label, revision in (('変更前', STARTUP_BEFORE), ('変更後', STARTUP_AFTER)):
+            tree = os.path.join(workdir, label)
+            os.mkdir(tree)
+            if _export_tree(revision, tree):
+                trees.append((f'{label}（{revision}）', tree))
+            else:
+                print(f"{label}（{revision}）: gitの履歴から取り出せないため省略します")
+        trees.append(('現在', HERE))
+
+        for label, tree in trees:
+            times = _measure_startup(tree, env, repeat)
+            if isinstance(times, str):
+                print(f"{label}: 起動に失敗（{times}）")
+            else:
+                print(
+                    f"{label}: コールド {times['cold'] * 1000:.1f} ms / ウォーム {times['warm'] * 1000:.1f} ms"
+                    f" / database.pyの読み込み直し {times['reload'] * 1000:.1f} ms"
+                )
+            print(f"  認証情報なしでのインポート: {_imports_without_credentials(tree, env)}")
+
+
+# サンプルデータに使うシフト文字列
+SAMPLE_SHIFTS = [
+    '-', '休み', '鹿屋', 'AM可', 'PM可', '1日可',
+    'AM可,9-12@本店', 'PM可,13-17@武店', '1日可,9-12@本店,13-17@クローバー',
+    '1日可,10-15@かご北', 'その他,研修', 'その他,研修,9-12@宇宿店',
+]
+
+
+def sample_shift_data(start_date, days, seed=0):
+    """日付×従業員のシフト文字列のサンプルを作成する"""
+    import pandas as pd
+    from constants import EMPLOYEES
+
+    rng = random.Random(seed)
+    index = pd.date_range(start=start_date, periods=days)
+    return pd.DataFrame(
+        [[rng.choice(SAMPLE_SHIFTS) for _ in EMPLOYEES] for _ in index],
+        index=index, columns=EMPLOYEES
+    )
+
+
+def bench_parse(repeat=5):
+    """1期間分のシフトの解析と、店舗ヘルプ希望の表の塗り分けにかかる時間を計測する"""
+    import pandas as pd
+    sys.path.insert(0, HERE)
+    from constants import AREAS, WEEKDAY_JA
+    from assignment_index import StoreAssignmentIndex
+    from shift_record import ShiftRecord, _parse_cached, parse_cache_stats
+    from utils import compute_help_coverage, highlight_help_coverage
+
+    start_date = pd.Timestamp(2024, 1, 16)
+    shift_data = sample_shift_data(start_date, 31)
+    area_stores = AREAS['中央エリア']
+    area_data = pd.DataFrame('-', index=shift_data.index, columns=area_stores)
+    area_data.insert(0, '曜日', shift_data.index.strftime('%a').map(WEEKDAY_JA))
+    area_data.insert(0, '日付', shift_data.index.strftime('%Y-%m-%d'))
+    area_data = area_data.reset_index(drop=True)
+
+    _parse_cached.cache_clear()
+    parse, records = _timeit(lambda: shift_data.map(ShiftRecord.parse), repeat)
+    stats = parse_cache_stats()
+    build, assignment_index = _timeit(lambda: StoreAssignmentIndex.from_shift_data(records), repeat)
+
+    help_requests = pd.DataFrame('10-15', index=shift_data.index, columns=area_stores)
+
+    def repaint():
+        coverage = compute_help_coverage(help_requests, assignment_index, area_stores)
+        return area_data.style.apply(highlight_help_coverage, coverage=coverage, axis=None).to_html()
+
+    best, _ = _timeit(repaint, repeat)
+    print(f"シフトの解析: {parse * 1000:.1f} ms（{repeat}回中の最小）")
+    print(f"解析キャッシュ: ヒット {stats['hits']} / ミス {stats['misses']}（ヒット率 {stats['hit_rate']:.1%}、{stats['size']}件保持）")
+    print(f"逆引きインデックスの作成: {build * 1000:.1f} ms（{repeat}回中の最小）")
+    print(f"ヘルプ表の塗り分け: {best * 1000:.1f} ms（{repeat}回中の最小）")
+
+
+def bench_assignments(repeat=5):
+    """期間全体の担当表への変換を、セルごとのparse_shiftのループとベクトル化した変換で比較する"""
+    import pandas as pd
+    sys.path.insert(0, HERE)
+    from shift_record import _parse_cached, build_assignment_table
+    from utils import parse_shift
+
+    def parse_loop(shift_data):
+        rows = []
+        for date, row in shift_data.iterrows():
+            for employee, shift in row.items():
+                shift_type, times, stores = parse_shift(shift)
+                if shift_type == 'その他':
+                    times = times[1:]
+                for slot, (time_range, store) in enumerate(zip(times, stores)):
+                    rows.append((date, employee, shift_type, slot, time_range, store))
+        return rows
+
+    def cold_parse_loop(shift_data):
+        _parse_cached.cache_clear()
+        return parse_loop(shift_data)
+
+    start_date = pd.Timestamp(2024, 1, 16)
+    for periods in (1, 12, 60):
+        end_date = start_date + pd.DateOffset(months=periods) - pd.Timedelta(days=1)
+        shift_data = sample_shift_data(start_date, len(pd.date_range(start_date, end_date)))
+        cold, _ = _timeit(lambda: cold_parse_loop(shift_data), repeat)
+        warm, _ = _timeit(lambda: parse_loop(shift_data), repeat)
+        vectorized, table = _timeit(lambda: build_assignment_table(shift_data), repeat)
+        print(
+            f"{periods}期間（{shift_data.size}セル、{len(table)}行）: "
+            f"parse_shiftループ {cold * 1000:.1f} ms（キャッシュ済み {warm * 1000:.1f} ms） / "
+            f"ベクトル化 {vectorized * 1000:.1f} ms"
+        )
+
+
+def bench_counts(repeat=5):
+    """シフト日数の集計を、セルごとのmapとカテゴリコードの集計で比較する"""
+    import pandas as pd
+    sys.path.insert(0, HERE)
+    from constants import EMPLOYEE_AREAS
+    from shift_record import ShiftRecord
+    from shift_counts import ShiftTypeCodes
+
+    def count_shift(shift):
+        shift_type = ShiftRecord.of(shift).type
+        if shift_type in ['1日可', '鹿屋', 'かご北', 'リクルート', 'その他']:
+            return 1
+        elif shift_type in ['AM可', 'PM可']:
+            return 0.5
+        return 0
+
+    def map_per_area(records):
+        # 以前の実装: エリアのタブごとにセルへmapしてから合計する
+        return {area: records[employees].map(count_shift).sum() for area, employees in EMPLOYEE_AREAS.items()}
+
+    records = sample_shift_data(pd.Timestamp(2024, 1, 16), 31).map(ShiftRecord.parse)
+    mapped, _ = _timeit(lambda: map_per_area(records), repeat)
+    build, shift_type_codes = _timeit(lambda: ShiftTypeCodes.from_shift_data(records), repeat)
+    counted, _ = _timeit(lambda: shift_type_codes.area_counts(EMPLOYEE_AREAS), repeat)
+    print(f"エリアごとのmap: {mapped * 1000:.2f} ms（{repeat}回中の最小）")
+    print(f"カテゴリコードの作成: {build * 1000:.2f} ms / 全エリアの集計: {counted * 1000:.2f} ms（{repeat}回中の最小）")
+
+
+def bench_merge(repeat=5):
+    """リランごとのセッション状態へのシフトのマージを、以前の実装（セルごとの.loc）とまとめた更新で比較する"""
+    import logging
+    import pandas as pd
+    import streamlit as st
+    sys.path.insert(0, HERE)
+    from constants import EMPLOYEES
+    from assignment_index import StoreAssignmentIndex
+    from shift_counts import ShiftTypeCodes
+    from shift_record import ShiftRecord, EMPTY_SHIFT
+    from utils import set_session_shift, update_session_state_shifts
+
+    # streamlit run の外ではsession_stateの警告が出るため抑止する
+    logging.getLogger('streamlit.runtime.state.session_state_proxy').setLevel(logging.ERROR)
+    start_date = pd.Timestamp(2024, 1, 16)
+    fetched_text = sample_shift_data(start_date, 31)
+    fetched = fetched_text.map(ShiftRecord.parse)
+    fetched.attrs['version'] = (('2024-01-16', '2024-02-15'), 0)
+
+    def reset():
+        st.session_state.shift_data = pd.DataFrame(index=fetched.index, columns=EMPLOYEES, data=EMPTY_SHIFT)
+        st.session_state.assignment_index = StoreAssignmentIndex()
+        st.session_state.shift_type_codes = ShiftTypeCodes(fetched.index, EMPLOYEES)
+        st.session_state.merged_shifts_version = None
+
+    def baseline():
+        # 以前の実装そのまま: 取得した文字列をセルごとに型を確認して.locで1つずつ書き込む（索引は持たない）
+        for date, row in fetched_text.iterrows():
+            if date in st.session_state.shift_data.index:
+                for employee, shift in row.items():
+                    if pd.notna(shift):
+                        if st.session_state.shift_data.dtypes[employee] != 'object':
+                            st.session_state.shift_data[employee] = st.session_state.shift_data[employee].astype('object')
+                        st.session_state.shift_data.loc[date, employee] = str(shift)
+                    else:
+                        st.session_state.shift_data.loc[date, employee] = '-'
+
+    def cell_by_cell():
+        # 以前のループのまま、1セルずつset_session_shiftで書き込む（セルごとに索引の更新とバージョンの更新を伴う）
+        for date, row in fetched.iterrows():
+            if date in st.session_state.shift_data.index:
+                for employee, shift in row.items():
+                    if st.session_state.shift_data.dtypes[employee] != 'object':
+                        st.session_state.shift_data[employee] = st.session_state.shift_data[employee].astype('object')
+                    set_session_shift(date, employee, shift)
+
+    def first_merge(merge):
+        reset()
+        merge()
+
+    def bulk_rerun():
+        # バージョンを変えて、内容が同じ取得結果のマージ（差分なし）を計測する
+        st.session_state.merged_shifts_version = None
+        update_session_state_shifts(fetched)
+
+    cold_baseline, _ = _timeit(lambda: first_merge(baseline), repeat)
+    cold_cells, _ = _timeit(lambda: first_merge(cell_by_cell), repeat)
+    cold_bulk, _ = _timeit(lambda: first_merge(lambda: update_session_state_shifts(fetched)), repeat)
+    warm_baseline, _ = _timeit(baseline, repeat)
+    warm_cells, _ = _timeit(cell_by_cell, repeat)
+    warm_bulk, _ = _timeit(bulk_rerun, repeat)
+    skipped, _ = _timeit(lambda: update_session_state_shifts(fetched), repeat)
+    print(f"{fetched.size}セル（{repeat}回中の最小）")
+    print(
+        f"初回のマージ: 以前の実装 {cold_baseline * 1000:.1f} ms / まとめて {cold_bulk * 1000:.1f} ms"
+        f"（参考: 索引の更新を伴うセルごとの書き込み {cold_cells * 1000:.1f} ms）"
+    )
+    print(
+        f"リラン（内容が同じ）: 以前の実装 {warm_baseline * 1000:.1f} ms / まとめて {warm_bulk * 1000:.1f} ms"
+        f"（参考: 索引の更新を伴うセルごとの書き込み {warm_cells * 1000:.1f} ms）"
+    )
+    print(f"リラン（バージョンが同じ）: {skipped * 1000:.3f} ms")
+    print("※まとめての更新は索引（ヘルプの逆引き・シフト日数のコード）の更新も含み、以前の実装は含まない")
+
+
+def bench_conflicts(repeat=5):
+    """シフトの重複検出を、期間全体の検査と保存時の1セルの再検査で計測する"""
+    import pandas as pd
+    sys.path.insert(0, HERE)
+    from conflicts import ConflictDetector
+    from shift_record import ShiftRecord
+
+    shift_data = sample_shift_data(pd.Timestamp(2024, 1, 16), 31).map(ShiftRecord.parse)
+    batch, detector = _timeit(lambda: ConflictDetector.from_shift_data(shift_data), repeat)
+
+    cells = [(date, employee) for date in shift_data.index for employee in shift_data.columns]
+    records = [ShiftRecord.parse(shift) for shift in SAMPLE_SHIFTS]
+
+    def update_all():
+        for i, (date, employee) in enumerate(cells):
+            detector.update(date, employee, records[i % len(records)])
+
+    updates, _ = _timeit(update_all, repeat)
+    print(f"期間全体の検査（{shift_data.size}セル、{len(detector)}件）: {batch * 1000:.1f} ms（{repeat}回中の最小）")
+    print(f"1セルの再検査: {updates / len(cells) * 1000:.3f} ms（{len(cells)}セルの平均）")
+
+
+def bench_gaps(repeat=5):
+    """1年分・全店舗の店舗ヘルプ希望の未充足の分析にかかる時間を計測する"""
+    import pandas as pd
+    sys.path.insert(0, HERE)
+    from constants import AREAS
+    from assignment_index import StoreAssignmentIndex
+    from help_gaps import analyze_help_gaps, summarize_help_gaps
+    from shift_record import ShiftRecord
+
+    stores = [store for area_stores in AREAS.values() for store in area_stores]
+    shift_data = sample_shift_data(pd.Timestamp(2024, 1, 16), 366).map(ShiftRecord.parse)
+    assignment_index = StoreAssignmentIndex.from_shift_data(shift_data)
+    rng = random.Random(0)
+    help_requests = pd.DataFrame(
+        [[rng.choice(['-', '10-15', '9-12', '13-17', '9半-13']) for _ in stores] for _ in shift_data.index],
+        index=shift_data.index, columns=stores
+    )
+
+    def analyze():
+        gaps = analyze_help_gaps(help_requests, assignment_index)
+        return gaps, [summarize_help_gaps(gaps, by) for by in ('store', 'area', 'period')]
+
+    best, (gaps, _) = _timeit(analyze, repeat)
+    print(f"1年分・{len(stores)}店舗（{len(gaps)}件の希望）の分析と集計: {best * 1000:.1f} ms（{repeat}回中の最小）")
+
+
+def bench_solver(repeat=5):
+    """1期間分の店舗ヘルプ希望に対する自動割り当て案の作成にかかる時間を計測する"""
+    import pandas as pd
+    sys.path.insert(0, HERE)
+    from constants import AREAS
+    from assignment_index import StoreAssignmentIndex
+    from help_solver import plan_help_assignments
+    from shift_counts import ShiftTypeCodes
+    from shift_record import ShiftRecord
+    from utils import compute_help_coverage, COVERAGE_NONE
+
+    stores = [store for area_stores in AREAS.values() for store in area_stores]
+    shift_data = sample_shift_data(pd.Timestamp(2024, 1, 16), 31).map(ShiftRecord.parse)
+    # 終了時刻のない担当（時間を解析できない担当）が入っているセルも混ぜる
+    shift_data.iloc[::4, 0] = ShiftRecord.parse('AM可,9-@本店')
+    assignment_index = StoreAssignmentIndex.from_shift_data(shift_data)
+    shift_type_codes = ShiftTypeCodes.from_shift_data(shift_data)
+    rng = random.Random(0)
+    help_requests = pd.DataFrame(
+        [[rng.choice(['-', '10-15', '9-12', '13-17', '9半-13']) for _ in stores] for _ in shift_data.index],
+        index=shift_data.index, columns=stores
+    )
+
+    best, plan = _timeit(lambda: plan_help_assignments(shift_data, help_requests, assignment_index, shift_type_codes), repeat)
+    # 割り当て案は、ヘルプ希望の表で塗られている（充足済み・一部充足の）セルを対象にしないこと
+    coverage = compute_help_coverage(help_requests, assignment_index, stores)
+    targeted = [coverage.at[date, store] for date, store in zip(plan['date'], plan['store'])]
+    assert all(status == COVERAGE_NONE for status in targeted), '割り当て案が充足済みのヘルプ希望を対象にしています'
+    print(
+        f"{len(shift_data.columns)}人×{len(stores)}店舗・1期間の割り当て案（{len(plan)}件）: "
+        f"{best * 1000:.1f} ms（{repeat}回中の最小）"
+    )
+
+
+def bench_table(repeat=5):
+    """全従業員・1期間分のシフト表のHTMLを、pandasのStylerとテンプレートの描画で比較する（時間とバイト数）"""
+    sys.path.insert(0, HERE)
+    from constants import EMPLOYEES
+    from pay_period import get_pay_period
+    from table_renderer import render_shift_table, SHIFT_TABLE_CSS
+    from utils import format_shifts, highlight_weekend_and_holiday, weekend_and_holiday_css
+
+    period = get_pay_period(2024, 1)
+    shift_data = sample_shift_data(period.start, len(period.dates))
+
+    def render_styler():
+        display_data = shift_data.reindex(period.dates)
+        display_data.insert(0, '曜日', period.weekdays)
+        display_data.insert(0, '日付', period.dates.strftime('%Y-%m-%d'))
+        styled_df = display_data.reset_index(drop=True).style.format(format_shifts, subset=EMPLOYEES)\
+            .apply(highlight_weekend_and_holiday, row_css=weekend_and_holiday_css(period), axis=None)
+        return styled_df.hide(axis="index").to_html(escape=False)
+
+    styler, styler_html = _timeit(render_styler, repeat)
+    template, template_html = _timeit(lambda: render_shift_table(period, shift_data, EMPLOYEES), repeat)
+    styler_bytes = len(styler_html.encode('utf-8'))
+    template_bytes = len(template_html.encode('utf-8'))
+    css_bytes = len(SHIFT_TABLE_CSS.encode('utf-8'))
+    print(f"{len(EMPLOYEES)}人×{len(period.dates)}日のシフト表")
+    print(f"Styler: {styler * 1000:.1f} ms（{repeat}回中の最小）、{styler_bytes:,} バイト")
+    print(
+        f"テンプレート: {template * 1000:.1f} ms（{repeat}回中の最小）、{template_bytes:,} バイト"
+        f"（共通のCSS {css_bytes:,} バイトは別に1回だけ）"
+    )
+    print(f"時間: {styler / template:.1f}倍速、サイズ: {template_bytes / styler_bytes:.1%}")
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'parse': bench_parse,
+    'assignments': bench_assignments,
+    'counts': bench_counts,
+    'merge': bench_merge,
+    'conflicts': bench_conflicts,
+    'gaps': bench_gaps,
+    'solver': bench_solver,
+    'table': bench_table,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ヘルプ管理アプリのパフォーマンス計測')
+    parser.add_argument('name', choices=list(BENCHMARKS.keys()))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    BENCHMARKS[args.name](repeat=args.repeat)
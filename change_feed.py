@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import threading
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 変更フィードが使えない場合にバージョンを確認する間隔（秒）
+POLL_INTERVAL = 10
+
+
+class LocalChangePublisher:
+    """プロセス内の変更通知
+
+    書き込み直後の反映や、Realtimeを使えない環境（テストなど）での代わりの配信元として使う。
+    購読者は callback(table, rows) の形で呼び出される。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def publish(self, table, rows):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(table, rows)
+            except Exception as e:
+                logger.exception("Change subscriber failed on %s: %s", table, e)
+
+
+class ShiftChangeFeed:
+    """shiftsテーブルの変更を購読し、共有キャッシュの該当するセルだけを更新する
+
+    SupabaseのRealtime（テーブルの変更ストリーム）に接続できればそれを使い、
+    接続できない場合や切断された場合は、安価なバージョン（最新のupdated_at）を
+    定期的に確認して、変わっていれば保持している期間だけを差分同期する。
+    """
+
+    def __init__(self, db, poll_interval=POLL_INTERVAL):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.mode = None
+        self.last_checked_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='shift-change-feed')
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_live(self):
+        """共有キャッシュが変更フィードによって最新に保たれているかどうか"""
+        if self.mode == 'realtime':
+            return True
+        if self.mode == 'polling' and self.last_checked_at is not None:
+            return time.time() - self.last_checked_at < self.poll_interval * 2
+        return False
+
+    def _run(self):
+        try:
+            self._listen_realtime()
+        except Exception as e:
+            logger.warning("Realtime unavailable, falling back to polling: %s", e)
+        self._poll()
+
+    def _listen_realtime(self):
+        from database import get_supabase_credentials, SupabaseDB
+        from realtime.connection import Socket
+
+        remote = getattr(self.db, 'remote', self.db)
+        if not isinstance(remote, SupabaseDB):
+            raise RuntimeError('Realtime is only available for the Supabase backend')
+
+        supabase_url, supabase_key = get_supabase_credentials()
+        ws_url = supabase_url.replace('https://', 'wss://').replace('http://', 'ws://')
+        # Socketは内部でasyncio.get_event_loop()を使うため、このスレッド専用のループを用意する
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        socket = Socket(f"{ws_url}/realtime/v1/websocket?apikey={supabase_key}&vsn=1.0.0")
+        socket.connect()
+        channel = socket.set_channel('realtime:public:shifts')
+        channel.join().on('*', self._on_realtime_message)
+        self.mode = 'realtime'
+        try:
+            # 接続が切れるまで戻らない
+            socket.listen()
+        finally:
+            self.mode = None
+
+    def _on_realtime_message(self, payload):
+        if payload.get('type') not in ('INSERT', 'UPDATE', 'DELETE'):
+            return
+        deleted = payload['type'] == 'DELETE'
+        record = payload.get('old_record' if deleted else 'record') or {}
+        if 'date' not in record or 'employee' not in record:
+            return
+        # updated_atは渡さない（取りこぼしがあった場合に差分同期の最高水位が先へ進まないように）
+        row = {
+            'date': record['date'],
+            'employee': record['employee'],
+            'shift': None if deleted else record.get('shift'),
+        }
+        self.db.changes.publish('shifts', [row])
+
+    def _poll(self):
+        self.mode = 'polling'
+        last_version = None
+        while not self._stop.is_set():
+            try:
+                version = self.db.get_shift_version()
+                if version is None and last_version is None:
+                    # バージョンを返さないバックエンドではポーリングせず、呼び出し側の差分同期に任せる
+                    logger.info("Shift version is not available; change feed polling disabled")
+                    self.mode = None
+                    return
+                if version != last_version:
+                    # 同期に失敗した期間があれば、次の確認でもう一度同期する
+                    if not self._sync_tracked_periods():
+                        self._stop.wait(self.poll_interval)
+                        continue
+                    last_version = version
+                self.last_checked_at = time.time()
+            except Exception as e:
+                logger.warning("Shift version polling failed: %s", e)
+            self._stop.wait(self.poll_interval)
+
+    def _sync_tracked_periods(self):
+        """保持している期間だけを差分同期する（すべて同期できたかどうかを返す）"""
+        synced = True
+        for start_date_str, end_date_str in self.db.shift_sync.keys():
+            try:
+                self.db.sync_shifts(pd.Timestamp(start_date_str), pd.Timestamp(end_date_str), raise_errors=True)
+            except Exception as e:
+                logger.warning("Shift sync failed for %s - %s: %s", start_date_str, end_date_str, e)
+                synced = False
+        return synced
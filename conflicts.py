@@ -0,0 +1,152 @@
+from collections import namedtuple
+import pandas as pd
+from shift_record import ShiftRecord, build_assignment_table
+
+# 衝突の種類
+DOUBLE_BOOKING = 'double_booking'  # 同じ従業員が同じ日に重なる時間帯で複数の担当に入っている
+STORE_OVERLAP = 'store_overlap'    # 同じ店舗に同じ日の重なる時間帯で複数の従業員が入っている
+
+# first・secondは (従業員, 時間, 店舗)。subjectは二重登録なら従業員、店舗の重複なら店舗
+Conflict = namedtuple('Conflict', ['kind', 'date', 'subject', 'first', 'second'])
+
+
+def _overlapping_pairs(intervals):
+    """(開始分, 終了分, 担当) のリストから、時間帯が重なる担当の組を返す
+
+    開始分で並べて走査し、まだ終わっていない担当とだけ比べる（9-12と12-15は重ならない）。
+    """
+    pairs = []
+    active = []
+    for start, end, item in sorted(intervals, key=lambda interval: interval[:2]):
+        active = [other for other in active if other[1] > start]
+        pairs.extend((other[2], item) for other in active)
+        active.append((start, end, item))
+    return pairs
+
+
+class ConflictDetector:
+    """期間のシフトの二重登録と、店舗での担当の重なりを検出する
+
+    従業員ごと（日付, 従業員）と店舗ごと（日付, 店舗）に時間帯のインデックスを持ち、
+    セルが変わったときは update() でそのセルと、そのセルに関わる店舗だけを検査し直す。
+    開始・終了の時刻を解析できない時間帯は検査の対象にしない。
+    """
+
+    def __init__(self):
+        # (日付, 従業員) -> [(開始分, 終了分, 時間, 店舗), ...]
+        self._by_employee = {}
+        # (日付, 店舗) -> {従業員: [(開始分, 終了分, 時間), ...]}
+        self._by_store = {}
+        # 検査結果（キーは上のインデックスと同じ）
+        self._employee_conflicts = {}
+        self._store_conflicts = {}
+
+    @classmethod
+    def from_shift_data(cls, shift_data):
+        """日付×従業員のシフトから期間全体をまとめて検査する（取り込み時などのバッチ検査用）"""
+        detector = cls()
+        table = build_assignment_table(shift_data)
+        table = table[table['start_min'].notna() & table['end_min'].notna()]
+        table = table[table['start_min'] < table['end_min']]
+        for date, employee, time, store, start_min, end_min in zip(
+            table['date'], table['employee'], table['time_text'], table['store'].fillna(''),
+            table['start_min'].astype(int), table['end_min'].astype(int)
+        ):
+            detector._by_employee.setdefault((date, employee), []).append((start_min, end_min, time, store))
+            if store:
+                detector._by_store.setdefault((date, store), {}).setdefault(employee, []).append((start_min, end_min, time))
+        for date, employee in detector._by_employee:
+            detector._check_employee(date, employee)
+        for date, store in detector._by_store:
+            detector._check_store(date, store)
+        return detector
+
+    def update(self, date, employee, shift):
+        """従業員のその日のシフトが変わったときに、そのセルと関係する店舗だけを検査し直す"""
+        date = pd.Timestamp(date)
+        touched_stores = {store for _, _, _, store in self._by_employee.pop((date, employee), ()) if store}
+        for store in touched_stores:
+            assignments = self._by_store.get((date, store), {})
+            assignments.pop(employee, None)
+            if not assignments:
+                self._by_store.pop((date, store), None)
+
+        intervals = [
+            (segment.start_min, segment.end_min, segment.time, segment.store)
+            for segment in ShiftRecord.of(shift).segments
+            if segment.is_time_valid and segment.end_min is not None and segment.start_min < segment.end_min
+        ]
+        if intervals:
+            self._by_employee[(date, employee)] = intervals
+        for start_min, end_min, time, store in intervals:
+            if store:
+                self._by_store.setdefault((date, store), {}).setdefault(employee, []).append((start_min, end_min, time))
+                touched_stores.add(store)
+
+        self._check_employee(date, employee)
+        for store in touched_stores:
+            self._check_store(date, store)
+
+    def _check_employee(self, date, employee):
+        intervals = [(start, end, (employee, time, store)) for start, end, time, store in self._by_employee.get((date, employee), ())]
+        conflicts = [Conflict(DOUBLE_BOOKING, date, employee, first, second) for first, second in _overlapping_pairs(intervals)]
+        self._set(self._employee_conflicts, (date, employee), conflicts)
+
+    def _check_store(self, date, store):
+        intervals = [
+            (start, end, (employee, time, store))
+            for employee, segments in self._by_store.get((date, store), {}).items()
+            for start, end, time in segments
+        ]
+        # 同じ従業員どうしの重なりは二重登録として検出済みのため除く
+        conflicts = [
+            Conflict(STORE_OVERLAP, date, store, first, second)
+            for first, second in _overlapping_pairs(intervals)
+            if first[0] != second[0]
+        ]
+        self._set(self._store_conflicts, (date, store), conflicts)
+
+    @staticmethod
+    def _set(results, key, conflicts):
+        if conflicts:
+            results[key] = conflicts
+        else:
+            results.pop(key, None)
+
+    def conflicts(self, start_date=None, end_date=None):
+        """期間内の衝突を日付順に返す（省略時はすべて）"""
+        found = [
+            conflict
+            for results in (self._employee_conflicts, self._store_conflicts)
+            for (date, _), conflicts in results.items()
+            if (start_date is None or date >= start_date) and (end_date is None or date <= end_date)
+            for conflict in conflicts
+        ]
+        return sorted(found, key=lambda conflict: (conflict.date, conflict.kind, conflict.subject))
+
+    def conflicts_for(self, date, employee):
+        """そのセルに関係する衝突（二重登録と、入っている店舗での重なり）を返す"""
+        date = pd.Timestamp(date)
+        stores = {store for _, _, _, store in self._by_employee.get((date, employee), ()) if store}
+        found = list(self._employee_conflicts.get((date, employee), []))
+        for store in stores:
+            found.extend(
+                conflict for conflict in self._store_conflicts.get((date, store), [])
+                if employee in (conflict.first[0], conflict.second[0])
+            )
+        return found
+
+    def __len__(self):
+        return sum(map(len, self._employee_conflicts.values())) + sum(map(len, self._store_conflicts.values()))
+
+
+def describe_conflict(conflict):
+    """衝突を画面表示用の文に変換する"""
+    first_employee, first_time, first_store = conflict.first
+    second_employee, second_time, second_store = conflict.second
+    date_str = conflict.date.strftime('%Y-%m-%d')
+    if conflict.kind == DOUBLE_BOOKING:
+        first = f'{first_time}@{first_store}' if first_store else first_time
+        second = f'{second_time}@{second_store}' if second_store else second_time
+        return f'{date_str} {conflict.subject}さん: {first} と {second} が重なっています'
+    return f'{date_str} {conflict.subject}: {first_employee}さん（{first_time}）と {second_employee}さん（{second_time}）が重なっています'
@@ -59,6 +59,7 @@ STORE_COLORS = {
 
 WEEKDAY_JA = {'Mon': '月', 'Tue': '火', 'Wed': '水', 'Thu': '木', 'Fri': '金', 'Sat': '土', 'Sun': '日'}
 FILLED_HELP_BG_COLOR = 'background-color: #D9D9D9'
+PARTIAL_HELP_BG_COLOR = 'background-color: #FFF2CC'  # ヘルプ希望の時間帯の一部だけが埋まっている場合
 SATURDAY_BG_COLOR = '#E6F2FF'  # 薄い青色
 SUNDAY_BG_COLOR = '#FFE6E6'    # 薄い赤色
 HOLIDAY_BG_COLOR = '#FFE6E6'  # 休み用の背景色
@@ -1,44 +1,414 @@
 import os
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pandas as pd
-from supabase import create_client, Client
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from constants import AREAS
+from shift_record import ShiftRecord
+from change_feed import LocalChangePublisher
 from dotenv import load_dotenv
 
-# ローカル環境の場合のみ.envファイルを読み込む
-if not os.environ.get('STREAMLIT_CLOUD'):
-    load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def load_env():
+    """ローカル環境の場合のみ.envファイルを読み込む（プロセスにつき1回だけ）"""
+    if not os.environ.get('STREAMLIT_CLOUD'):
+        load_dotenv()
+
+
+# 一括Upsertで1リクエストに含める最大行数
+BULK_CHUNK_SIZE = 500
+
+# 1ページで取得する行数（PostgRESTのmax-rows以下にすること）
+PAGE_SIZE = 1000
+# 並行して取得するページ数のデフォルト（1の場合は順番に取得）
+DEFAULT_PAGE_WORKERS = 4
+
+# 取得する列（使わない列は転送しない）
+SHIFT_COLUMNS = 'date,employee,shift'
+HELP_COLUMNS = 'date,store,help_time'
+
+# 利用可能なストレージバックエンド
+BACKENDS = ['supabase', 'sqlite', 'sqlite_cache']
+DEFAULT_SQLITE_PATH = 'help3.db'
+
+
+@functools.lru_cache(maxsize=None)
+def database_secrets():
+    """st.secretsの[database]セクションを返す（プロセスにつき1回だけ読み込む）"""
+    try:
+        if "database" in st.secrets:
+            return dict(st.secrets["database"])
+    except:
+        pass  # st.secretsが使えない場合は空として扱う
+    return {}
+
+
+def get_setting(key, env_key, default=None):
+    """st.secretsの[database]セクション、環境変数の順に設定値を取得する"""
+    load_env()
+    secrets = database_secrets()
+    if key in secrets:
+        return secrets[key]
+    return os.getenv(env_key, default)
+
+
+class ShiftSyncState:
+    """期間ごとのシフトのピボットと、updated_atの最高水位（ウォーターマーク）を保持する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        """期間のエントリ（pivot, watermark, version）を返す。未取得の場合はNone"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry else None
+
+    def replace(self, key, pivot, watermark):
+        """期間のピボットを丸ごと置き換える"""
+        with self._lock:
+            version = self._entries[key]['version'] + 1 if key in self._entries else 0
+            self._entries[key] = {'pivot': pivot, 'watermark': watermark, 'version': version}
+
+    def patch(self, key, rows):
+        """更新された行だけをピボットに反映し、値が変わった場合はバージョンを進める"""
+        with self._lock:
+            entry = self._entries[key]
+            # 読み取り中の呼び出し元に影響しないよう、コピーに対してパッチする
+            pivot = entry['pivot'].copy()
+            changed = False
+            for row in rows:
+                date = pd.Timestamp(row['date'])
+                employee = row['employee']
+                shift = ShiftRecord.parse(row['shift']) if row['shift'] is not None else None
+                current = pivot.at[date, employee] if date in pivot.index and employee in pivot.columns else None
+                if pd.isna(current) and shift is None:
+                    pass  # 削除済みのセルへの削除は変更なし
+                elif current != shift:
+                    if employee not in pivot.columns:
+                        pivot[employee] = pd.Series(index=pivot.index, dtype=object)
+                    pivot.loc[date, employee] = shift
+                    changed = True
+                if row.get('updated_at') and (entry['watermark'] is None or row['updated_at'] > entry['watermark']):
+                    entry['watermark'] = row['updated_at']
+            if changed:
+                entry['pivot'] = pivot.sort_index()
+                entry['version'] += 1
+            return changed
+
+    def keys(self):
+        """保持している期間のキー (開始日, 終了日) のリストを返す"""
+        with self._lock:
+            return list(self._entries.keys())
+
+    def invalidate(self, key=None):
+        """期間（省略時はすべて）の同期状態を破棄する"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class BaseDB:
+    """ストレージバックエンドの共通処理
+
+    サブクラスは init_db / _fetch_shift_rows / _fetch_help_rows / _upsert_in_chunks を実装する。
+    変更フィードのポーリングを使うバックエンドは get_shift_version も実装する。
+    """
 
-class SupabaseDB:
     def __init__(self):
+        # 差分同期用の期間ごとの状態
+        self.shift_sync = ShiftSyncState()
+        # 書き込みや変更フィードからの変更通知を受け取り、該当するセルだけをパッチする
+        self.changes = LocalChangePublisher()
+        self.changes.subscribe(self._apply_changes)
+
+    def _apply_changes(self, table, rows):
+        """変更された行を、その日付を含む期間のピボットにだけ反映する"""
+        if table != 'shifts':
+            return
+        for key in self.shift_sync.keys():
+            period_rows = [row for row in rows if key[0] <= row['date'][:10] <= key[1]]
+            if period_rows:
+                self.shift_sync.patch(key, period_rows)
+
+    def get_shift_version(self):
+        """shiftsテーブル全体の更新を検知するための安価なバージョン（最新のupdated_at）を返す
+
+        Noneを返すバックエンドでは、変更フィードはポーリングを行わない。
+        """
+        return None
+
+    def get_shifts(self, start_date, end_date):
         try:
-            # デプロイ環境ではst.secretsから読み込む
-            # ローカル環境では.envから読み込む
-            supabase_url = None
-            supabase_key = None
-            
-            # まずSecrets APIから取得を試みる
-            try:
-                if "database" in st.secrets:
-                    supabase_url = st.secrets["database"]["supabase_url"]
-                    supabase_key = st.secrets["database"]["supabase_key"]
-            except:
-                pass  # st.secretsが使えない場合は次の方法へ
+            start_date_str = start_date.strftime('%Y-%m-%d')
+            end_date_str = end_date.strftime('%Y-%m-%d')
             
-            # Secretsから取得できなかった場合は.envから読み込む
-            if not supabase_url or not supabase_key:
-                load_dotenv()
-                supabase_url = os.getenv("SUPABASE_URL")
-                supabase_key = os.getenv("SUPABASE_KEY")
+            # データを取得し、ピボットテーブルを作成
+            rows = self._fetch_shift_rows(start_date_str, end_date_str)
+            return self._build_shift_pivot(rows)
             
-            # 接続情報がない場合はエラー
-            if not supabase_url or not supabase_key:
-                st.error("データベース接続情報が見つかりません")
-                raise Exception("Supabase の認証情報が設定されていません")
+        except Exception as e:
+            st.error(f"シフトデータの取得エラー: {e}")
+            return pd.DataFrame()
+
+    def sync_shifts(self, start_date, end_date, use_cache=False, raise_errors=False):
+        """差分同期モードでシフトを取得する
+
+        期間ごとに前回のピボットとupdated_atの最高水位を保持し、2回目以降は
+        最高水位以降に更新された行だけを取得してピボットにパッチする。
+        use_cache=Trueの場合（変更フィードで共有キャッシュが最新に保たれている場合）は、
+        取得済みの期間なら問い合わせずにそのまま返す。
+        raise_errors=Trueの場合は、取得エラーをst.errorで表示せずにそのまま送出する
+        （st.errorが使えないバックグラウンドスレッドから呼ぶ場合）。
+        """
+        key = (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        try:
+            entry = self.shift_sync.get(key)
+            if use_cache and entry is not None:
+                return self._versioned_pivot(key, entry)
+            if entry is None or entry['watermark'] is None:
+                # 初回（またはupdated_atが取得できない場合）は期間全体を取得
+                rows = self._fetch_shift_rows(*key, with_updated_at=True)
+                watermark = max((row['updated_at'] for row in rows if row.get('updated_at')), default=None)
+                self.shift_sync.replace(key, self._build_shift_pivot(rows), watermark)
+            else:
+                # 同一時刻に複数の更新がある場合の取りこぼしを防ぐため、最高水位と同じ時刻も含めて取得
+                rows = self._fetch_shift_rows(*key, updated_since=entry['watermark'], with_updated_at=True)
+                self.shift_sync.patch(key, rows)
+            return self._versioned_pivot(key, self.shift_sync.get(key))
+
+        except Exception as e:
+            if raise_errors:
+                raise
+            st.error(f"シフトデータの取得エラー: {e}")
+            return pd.DataFrame()
+
+    @staticmethod
+    def _versioned_pivot(key, entry):
+        """期間のピボットのコピーを、(期間, バージョン) を attrs['version'] に付けて返す
+
+        呼び出し元は前回と同じバージョンなら内容も同じとみなして処理を省略できる。
+        """
+        pivot = entry['pivot'].copy()
+        pivot.attrs['version'] = (key, entry['version'])
+        return pivot
+
+    def prefetch_shift_periods(self, periods, skip_cached=False):
+        """連続する期間のシフトを範囲クエリで取得し、期間ごとの同期状態に分割して保存する
+
+        隣り合う期間はまとめて1回の範囲クエリで取得する。バックグラウンドスレッドから
+        呼ばれるため、エラーはst.errorではなくログに出力する。
+
+        Args:
+            periods (list): (開始日, 終了日) のタプルのリスト（日付順）
+            skip_cached (bool): Trueの場合、同期状態を持っている期間は取得しない
+        """
+        try:
+            keys = [(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')) for start, end in periods]
+            if skip_cached:
+                cached = set(self.shift_sync.keys())
+                keys = [key for key in keys if key not in cached]
+
+            # 隣り合う期間（前の期間の翌日から始まる期間）ごとにまとめる
+            runs = []
+            for key in keys:
+                if runs and pd.Timestamp(runs[-1][-1][1]) + pd.Timedelta(days=1) == pd.Timestamp(key[0]):
+                    runs[-1].append(key)
+                else:
+                    runs.append([key])
+
+            for run in runs:
+                rows = self._fetch_shift_rows(run[0][0], run[-1][1], with_updated_at=True)
+                overall_watermark = max((row['updated_at'] for row in rows if row.get('updated_at')), default=None)
+                for key in run:
+                    # 日付は YYYY-MM-DD 形式の文字列なので文字列比較で期間に振り分けられる
+                    period_rows = [row for row in rows if key[0] <= row['date'][:10] <= key[1]]
+                    watermark = max(
+                        (row['updated_at'] for row in period_rows if row.get('updated_at')),
+                        default=overall_watermark
+                    )
+                    self.shift_sync.replace(key, self._build_shift_pivot(period_rows), watermark)
+            return True
+
+        except Exception:
+            logger.exception("シフトデータの先読みエラー")
+            return False
+
+    @staticmethod
+    def _build_shift_pivot(rows):
+        """シフト行を日付×従業員のピボットに変換する"""
+        if not rows:
+            return pd.DataFrame()
+        df = pd.DataFrame(rows)
+        df['date'] = pd.to_datetime(df['date'])
+        # シフト文字列は取得時に一度だけ解析し、以降はShiftRecordとして扱う
+        df['shift'] = df['shift'].map(ShiftRecord.parse)
+        return df.pivot(index='date', columns='employee', values='shift')
+
+    @staticmethod
+    def _build_help_pivot(rows):
+        """店舗ヘルプ希望の行を日付×店舗のピボットに変換する"""
+        if not rows:
+            return pd.DataFrame()
+        df = pd.DataFrame(rows)
+        df['date'] = pd.to_datetime(df['date'])
+        pivot_df = df.pivot(index='date', columns='store', values='help_time').fillna('-')
+
+        # 全ての店舗列が存在することを確認
+        all_stores = [store for stores in AREAS.values() for store in stores]
+        for store in all_stores:
+            if store not in pivot_df.columns:
+                pivot_df[store] = '-'
+
+        return pivot_df
+
+    @staticmethod
+    def _shift_rows(shifts):
+        """(日付, 従業員, シフト文字列) をUpsert用の行と元レコードのリストに変換する"""
+        records = {}
+        for date, employee, shift_str in shifts:
+            date_str = date.strftime('%Y-%m-%d')
+            # 同じキーが複数ある場合は後勝ち（同一リクエスト内の重複はUpsertできないため）
+            records[(date_str, employee)] = (date, employee, shift_str)
+
+        rows = [
+            {'date': date_str, 'employee': employee, 'shift': record[2]}
+            for (date_str, employee), record in records.items()
+        ]
+        return rows, list(records.values())
+
+    @staticmethod
+    def _help_rows(help_requests):
+        """(日付, 店舗, 時間帯) をUpsert用の行と元レコードのリストに変換する"""
+        records = {}
+        for date, store, help_time in help_requests:
+            date_str = date.strftime('%Y-%m-%d')
+            records[(date_str, store)] = (date, store, help_time)
+
+        rows = [
+            {'date': date_str, 'store': store, 'help_time': record[2]}
+            for (date_str, store), record in records.items()
+        ]
+        return rows, list(records.values())
+
+    def save_shift(self, date, employee, shift_str):
+        return not self.save_shifts_bulk([(date, employee, shift_str)])
+
+    def save_store_help_request(self, date, store, help_time):
+        return not self.save_store_help_requests_bulk([(date, store, help_time)])
+
+    def save_shifts_bulk(self, shifts):
+        """複数のシフトを一括でUpsertし、保存に失敗した行のリストを返す
+
+        Args:
+            shifts (list): (日付, 従業員, シフト文字列) のタプルのリスト
+
+        Returns:
+            list: 保存に失敗した (日付, 従業員, シフト文字列) のリスト
+        """
+        rows, records = self._shift_rows(shifts)
+        failed = self._upsert_in_chunks('shifts', rows, records)
+        self.publish_saved('shifts', rows, records, failed)
+        # 書き込みキューのスレッドから呼ばれるため画面には出さず、失敗した行は戻り値で返す
+        if failed:
+            logger.error("シフトの保存エラー: %d件の保存に失敗しました", len(failed))
+        return failed
+
+    def save_store_help_requests_bulk(self, help_requests):
+        """複数の店舗ヘルプ希望を一括でUpsertし、保存に失敗した行のリストを返す
+
+        Args:
+            help_requests (list): (日付, 店舗, 時間帯) のタプルのリスト
+
+        Returns:
+            list: 保存に失敗した (日付, 店舗, 時間帯) のリスト
+        """
+        rows, records = self._help_rows(help_requests)
+        failed = self._upsert_in_chunks('store_help_requests', rows, records)
+        self.publish_saved('store_help_requests', rows, records, failed)
+        if failed:
+            logger.error("店舗ヘルプ希望の保存エラー: %d件の保存に失敗しました", len(failed))
+        return failed
+
+    @staticmethod
+    def _is_row_error(error):
+        """一括Upsertのエラーが行の内容によるもの（その行を除けば保存できる）かどうか
+
+        PostgRESTは、データの不正（SQLSTATE 22xxx）と制約違反（23xxx）を4xxで返す。
+        接続エラー・タイムアウト・5xxは行によらないため、1行ずつ再送しても失敗が増えるだけになる。
+        """
+        code = getattr(error, 'code', None)
+        return isinstance(code, str) and code[:2] in ('22', '23')
+
+    def publish_saved(self, table, rows, records, failed):
+        """保存に成功した行をプロセス内に通知し、共有キャッシュへ即座に反映する"""
+        failed_ids = {id(record) for record in failed}
+        saved_rows = [row for row, record in zip(rows, records) if id(record) not in failed_ids]
+        if saved_rows:
+            self.changes.publish(table, saved_rows)
+
+    def get_store_help_requests(self, start_date, end_date):
+        try:
+            start_date_str = start_date.strftime('%Y-%m-%d')
+            end_date_str = end_date.strftime('%Y-%m-%d')
+
+            # データを取得し、ピボットテーブルを作成
+            rows = self._fetch_help_rows(start_date_str, end_date_str)
+            return self._build_help_pivot(rows)
+
+        except Exception as e:
+            st.error(f"店舗ヘルプ希望の取得エラー: {e}")
+            return pd.DataFrame()
+
+
+def get_supabase_credentials():
+    """SupabaseのURLとキーを取得する"""
+    # デプロイ環境ではst.secretsから読み込む
+    # ローカル環境では.envから読み込む
+    # まずSecrets APIから取得を試みる
+    secrets = database_secrets()
+    supabase_url = secrets.get("supabase_url")
+    supabase_key = secrets.get("supabase_key")
+    
+    # Secretsから取得できなかった場合は.envから読み込む
+    if not supabase_url or not supabase_key:
+        load_env()
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_KEY")
+    
+    # 接続情報がない場合はエラー
+    if not supabase_url or not supabase_key:
+        st.error("データベース接続情報が見つかりません")
+        raise Exception("Supabase の認証情報が設定されていません")
+
+    return supabase_url, supabase_key
+
+
+class SupabaseDB(BaseDB):
+    def __init__(self):
+        super().__init__()
+        try:
+            supabase_url, supabase_key = get_supabase_credentials()
             
+            # supabaseパッケージはSupabaseバックエンドを使う場合のみ必要
+            from supabase import create_client, Client
+
             # デバッグ表示は削除（デプロイには不要）
             self.supabase: Client = create_client(supabase_url, supabase_key)
+
+            # 大きな範囲を取得する際に並行して取得するページ数
+            self.page_workers = max(1, int(get_setting('page_workers', 'SUPABASE_PAGE_WORKERS', DEFAULT_PAGE_WORKERS)))
+            self._executor = None
             
         except Exception as e:
             st.error(f"データベース接続エラー: {str(e)}")
@@ -54,102 +424,146 @@ class SupabaseDB:
             st.error(f"データベース接続エラー: {e}")
             return False
 
-    def get_shifts(self, start_date, end_date):
-        try:
-            start_date_str = start_date.strftime('%Y-%m-%d')
-            end_date_str = end_date.strftime('%Y-%m-%d')
-            
-            # Supabaseからデータを取得
-            response = self.supabase.table('shifts')\
-                .select("*")\
+    def _fetch_shift_rows(self, start_date_str, end_date_str, updated_since=None, with_updated_at=False):
+        """期間内のシフト行を取得する（updated_since指定時はそれ以降に更新された行のみ）"""
+        columns = SHIFT_COLUMNS + ',updated_at' if with_updated_at or updated_since is not None else SHIFT_COLUMNS
+
+        def build_query():
+            query = self.supabase.table('shifts')\
+                .select(columns)\
                 .gte('date', start_date_str)\
-                .lte('date', end_date_str)\
-                .execute()
-            
-            if not response.data:
-                return pd.DataFrame()
-            
-            # データフレームに変換
-            df = pd.DataFrame(response.data)
-            df['date'] = pd.to_datetime(df['date'])
-            
-            # ピボットテーブルを作成
-            pivot_df = df.pivot(index='date', columns='employee', values='shift')
-            return pivot_df
-            
-        except Exception as e:
-            st.error(f"シフトデータの取得エラー: {e}")
-            return pd.DataFrame()
+                .lte('date', end_date_str)
+            if updated_since is not None:
+                query = query.gte('updated_at', updated_since)
+            # ページングの順序を安定させるため主キー順に並べる
+            return query.order('date').order('employee')
 
-    def save_shift(self, date, employee, shift_str):
-        try:
-            date_str = date.strftime('%Y-%m-%d')
-            
-            # データをUpsert（更新または挿入）
-            self.supabase.table('shifts')\
-                .upsert({
-                    'date': date_str,
-                    'employee': employee,
-                    'shift': shift_str
-                })\
-                .execute()
-            
-            return True
-        except Exception as e:
-            st.error(f"シフトの保存エラー: {e}")
-            return False
+        return [row for page in self._iter_pages(build_query) for row in page]
 
-    def save_store_help_request(self, date, store, help_time):
-        try:
-            date_str = date.strftime('%Y-%m-%d')
-            
-            # データをUpsert
-            self.supabase.table('store_help_requests')\
-                .upsert({
-                    'date': date_str,
-                    'store': store,
-                    'help_time': help_time
-                })\
-                .execute()
-            
-            return True
-        except Exception as e:
-            st.error(f"店舗ヘルプ希望の保存エラー: {e}")
-            return False
+    def get_shift_version(self):
+        response = self.supabase.table('shifts')\
+            .select('updated_at')\
+            .order('updated_at', desc=True)\
+            .limit(1)\
+            .execute()
+        return response.data[0]['updated_at'] if response.data else None
 
-    def get_store_help_requests(self, start_date, end_date):
-        try:
-            start_date_str = start_date.strftime('%Y-%m-%d')
-            end_date_str = end_date.strftime('%Y-%m-%d')
-            
-            # Supabaseからデータを取得
-            response = self.supabase.table('store_help_requests')\
-                .select("*")\
+    def _fetch_help_rows(self, start_date_str, end_date_str):
+        """期間内の店舗ヘルプ希望の行を取得する"""
+        def build_query():
+            return self.supabase.table('store_help_requests')\
+                .select(HELP_COLUMNS)\
                 .gte('date', start_date_str)\
                 .lte('date', end_date_str)\
-                .execute()
-            
-            if not response.data:
-                return pd.DataFrame()
-            
-            # データフレームに変換
-            df = pd.DataFrame(response.data)
-            df['date'] = pd.to_datetime(df['date'])
-            
-            # ピボットテーブルを作成
-            pivot_df = df.pivot(index='date', columns='store', values='help_time').fillna('-')
-            
-            # 全ての店舗列が存在することを確認
-            all_stores = [store for stores in AREAS.values() for store in stores]
-            for store in all_stores:
-                if store not in pivot_df.columns:
-                    pivot_df[store] = '-'
-            
-            return pivot_df
-            
-        except Exception as e:
-            st.error(f"店舗ヘルプ希望の取得エラー: {e}")
-            return pd.DataFrame()
+                .order('date')\
+                .order('store')
+
+        return [row for page in self._iter_pages(build_query) for row in page]
+
+    def _iter_pages(self, build_query):
+        """PostgRESTの行数上限で切り捨てられないよう、Rangeヘッダでページングして順に返す
+
+        最初のページが上限まで埋まっていた場合は、続くページを page_workers 件ずつ並行して取得する。
+        """
+        def fetch_page(offset):
+            # このバージョンのpostgrestのrange()は終端を含まない
+            return build_query().range(offset, offset + PAGE_SIZE).execute().data or []
+
+        page = fetch_page(0)
+        yield page
+        offset = PAGE_SIZE
+        while len(page) == PAGE_SIZE:
+            offsets = [offset + i * PAGE_SIZE for i in range(self.page_workers)]
+            if len(offsets) == 1:
+                pages = [fetch_page(offsets[0])]
+            else:
+                pages = list(self._page_executor().map(fetch_page, offsets))
+            for page in pages:
+                if page:
+                    yield page
+                if len(page) < PAGE_SIZE:
+                    break
+            offset = offsets[-1] + PAGE_SIZE
+
+    def _page_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.page_workers, thread_name_prefix='supabase-page')
+        return self._executor
+
+    def _upsert_in_chunks(self, table, rows, records):
+        """行をチャンクごとにまとめてUpsertし、失敗した元レコードを返す"""
+        failed = []
+        for i in range(0, len(rows), BULK_CHUNK_SIZE):
+            chunk_rows = rows[i:i + BULK_CHUNK_SIZE]
+            chunk_records = records[i:i + BULK_CHUNK_SIZE]
+            try:
+                self.supabase.table(table).upsert(chunk_rows).execute()
+            except Exception as e:
+                if not self._is_row_error(e):
+                    # 接続エラーなどはどの行でも同じように失敗するため、チャンク全体を失敗とする
+                    logger.warning("Upsert of %d rows failed on %s: %s", len(chunk_rows), table, e)
+                    failed.extend(chunk_records)
+                    continue
+                # 行の内容によるエラーの場合は1行ずつ再送して失敗した行を特定する
+                for row, record in zip(chunk_rows, chunk_records):
+                    try:
+                        self.supabase.table(table).upsert(row).execute()
+                    except Exception as e:
+                        logger.warning("Upsert failed on %s: %s. Error: %s", table, row, e)
+                        failed.append(record)
+        return failed
+
+
+def create_db(backend=None):
+    """設定（[database] backend / DB_BACKEND）に応じたストレージバックエンドを生成する
+
+    - supabase: Supabaseに直接接続（デフォルト）
+    - sqlite: ローカルのSQLiteファイルのみを使用（オフライン・ベンチマーク用）
+    - sqlite_cache: SQLiteをSupabaseの前段の読み取りキャッシュとして使用
+    """
+    backend = backend or get_setting('backend', 'DB_BACKEND', 'supabase')
+    if backend not in BACKENDS:
+        raise ValueError(f"不明なデータベースバックエンドです: {backend}")
+    if backend == 'supabase':
+        return SupabaseDB()
+
+    from sqlite_db import SQLiteDB, SQLiteCachedDB
+    sqlite_path = get_setting('sqlite_path', 'SQLITE_PATH', DEFAULT_SQLITE_PATH)
+    if backend == 'sqlite':
+        return SQLiteDB(sqlite_path)
+    return SQLiteCachedDB(SupabaseDB(), SQLiteDB(sqlite_path))
+
+
+@st.cache_resource
+def _create_shared_db():
+    return create_db()
+
+
+_shared_db = None
+
+
+def get_db():
+    """プロセス全体で共有するデータベースインスタンスを返す
+
+    初回呼び出し時にだけクライアントを生成し、以降のリランやセッションでは
+    同じインスタンス（とHTTPのkeep-alive接続）を使い回す。
+    st.cache_resourceはスクリプトの実行コンテキスト外では値を保持しないため、
+    バックグラウンドスレッドからは直近に取得したインスタンスを返す。
+    """
+    global _shared_db
+    # st.secretsの読み込み時の警告がキャッシュされて毎回再表示されないよう、先に読み込んでおく
+    database_secrets()
+    if _shared_db is None or get_script_run_ctx() is not None:
+        _shared_db = _create_shared_db()
+    return _shared_db
+
+
+class _LazyDB:
+    """属性に初めてアクセスした時点でget_db()を呼び出すプロキシ"""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
 
-# データベースのシングルトンインスタンスを作成
-db = SupabaseDB()
\ No newline at end of file
+# モジュールのインポート時には接続せず、最初の利用時にインスタンスを作成する
+db = _LazyDB()
\ No newline at end of file
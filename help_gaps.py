@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from shift_record import STORE_AREAS, time_range_minutes
+from pay_period import PERIOD_START_DAY
+
+# 希望ごとの分析結果の列（unknown_timeは、時間を解析できない担当がいるかどうか）
+GAP_COLUMNS = ['date', 'store', 'area', 'help_time', 'start_min', 'end_min', 'requested_min', 'covered_min', 'uncovered_min', 'unknown_time']
+# 希望の充足状況（ヘルプ希望の表の塗り分けと、自動割り当ての対象の判定に使う）
+COVERAGE_FULL = 'full'
+COVERAGE_PARTIAL = 'partial'
+COVERAGE_NONE = ''
+# 集計結果の列
+SUMMARY_COLUMNS = ['requests', 'requested_min', 'covered_min', 'uncovered_min']
+
+
+def _covered_minutes(cells, starts, ends, request_starts, request_ends, count):
+    """希望の時間帯ごとに、担当の時間帯の和集合で覆われている分数を求める
+
+    担当の時間帯を希望の時間帯に切り詰めてから (希望, 開始) で並べ、希望ごとに
+    それまでの終了分の最大値と比べて新しく覆われた分だけを足す（区間の併合）。
+
+    Args:
+        cells (np.ndarray): 担当の時間帯が対応する希望の番号
+        starts, ends (np.ndarray): 担当の時間帯の開始分・終了分
+        request_starts, request_ends (np.ndarray): 希望の開始分・終了分（希望の番号順）
+        count (int): 希望の数
+    """
+    starts = np.maximum(starts, request_starts[cells])
+    ends = np.minimum(ends, request_ends[cells])
+    keep = starts < ends
+    cells, starts, ends = cells[keep], starts[keep], ends[keep]
+    order = np.lexsort((starts, cells))
+    cells, starts, ends = cells[order], starts[order], ends[order]
+
+    # 希望ごとに区切った終了分の累積最大値（希望の番号でずらして、前の希望の値を引き継がないようにする）
+    offset = cells * (2 * 24 * 60 + 1)
+    running_end = np.maximum.accumulate(ends + offset) - offset
+    previous_end = np.empty_like(running_end)
+    previous_end[1:] = running_end[:-1]
+    first = np.ones(len(cells), dtype=bool)
+    first[1:] = cells[1:] != cells[:-1]
+    previous_end[first] = starts[first]
+
+    added = np.maximum(ends - np.maximum(starts, previous_end), 0)
+    return np.bincount(cells, weights=added, minlength=count).astype(int)
+
+
+def analyze_help_gaps(store_help_requests, assignment_index, stores=None):
+    """店舗ヘルプ希望ごとに、担当の時間帯で覆われずに残っている分数を求める
+
+    希望時間帯を解析できない希望は対象にしない。担当の時間を解析できない場合は、
+    その担当は覆っている分数には数えず、unknown_time を True にする。
+
+    Args:
+        store_help_requests (pd.DataFrame): 日付×店舗の希望時間帯
+        assignment_index (StoreAssignmentIndex): (日付, 店舗) の逆引きインデックス
+        stores (list): 対象の店舗（省略時はピボットのすべての店舗）
+
+    Returns:
+        pd.DataFrame: GAP_COLUMNS の列を持つ希望ごとの分析結果
+    """
+    if store_help_requests.empty:
+        return pd.DataFrame(columns=GAP_COLUMNS)
+    help_times = store_help_requests if stores is None else store_help_requests.reindex(columns=stores)
+    dates = pd.DatetimeIndex(help_times.index)
+    columns = list(help_times.columns)
+
+    # 希望時間帯（開始分・終了分）。同じ文字列が多いため、種類ごとに1回だけ解析する
+    cells = help_times.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(cells.ravel())
+    unique_start, unique_end = time_range_minutes(pd.Series(uniques, dtype=object))
+    unique_start = np.append(unique_start.to_numpy(dtype=float, na_value=np.nan), np.nan)
+    unique_end = np.append(unique_end.to_numpy(dtype=float, na_value=np.nan), np.nan)
+    cell_start, cell_end = unique_start[codes].reshape(cells.shape), unique_end[codes].reshape(cells.shape)
+    rows, cols = np.nonzero(cell_start < cell_end)
+
+    # (日付, 店舗) の位置から希望の番号を引く表
+    request_ids = np.full(cells.shape, -1)
+    request_ids[rows, cols] = np.arange(len(rows))
+    request_starts = cell_start[rows, cols].astype(int)
+    request_ends = cell_end[rows, cols].astype(int)
+
+    # 希望のある (日付, 店舗) の担当の時間帯を集める
+    date_positions = {date: i for i, date in enumerate(dates)}
+    store_positions = {store: i for i, store in enumerate(columns)}
+    segments = []
+    unknown_time = np.zeros(len(rows), dtype=bool)
+    for date, store, start_min, end_min in assignment_index.iter_segments(dates[np.unique(rows)]):
+        column = store_positions.get(store)
+        if column is None:
+            continue
+        request_id = request_ids[date_positions[date], column]
+        if request_id < 0:
+            continue
+        if start_min is None or end_min is None or start_min >= end_min:
+            unknown_time[request_id] = True
+        else:
+            segments.append((request_id, start_min, end_min))
+    segments = np.array(segments, dtype=int).reshape(-1, 3)
+    covered = _covered_minutes(segments[:, 0], segments[:, 1], segments[:, 2], request_starts, request_ends, len(rows))
+
+    store_names = np.array(columns, dtype=object)[cols]
+    gaps = pd.DataFrame({
+        'date': dates[rows],
+        'store': store_names,
+        'area': pd.Series(store_names, dtype=object).map(STORE_AREAS).to_numpy(),
+        'help_time': cells[rows, cols],
+        'start_min': request_starts,
+        'end_min': request_ends,
+        'requested_min': request_ends - request_starts,
+        'covered_min': covered,
+    })
+    gaps['uncovered_min'] = gaps['requested_min'] - gaps['covered_min']
+    gaps['unknown_time'] = unknown_time
+    return gaps[GAP_COLUMNS]
+
+
+def coverage_status(gaps):
+    """希望ごとの充足状況を返す
+
+    希望時間帯をすべて覆っているか、時間を解析できない担当がいれば full（覆っているかを
+    判断できないため埋まっているとみなす）、1分以上覆っていれば partial、どの分も覆って
+    いなければ空。表の塗り分けと自動割り当ての対象はこの規則だけで決めること。
+    """
+    full = (gaps['uncovered_min'] <= 0).to_numpy() | gaps['unknown_time'].to_numpy(dtype=bool)
+    partial = (gaps['covered_min'] > 0).to_numpy()
+    return np.where(full, COVERAGE_FULL, np.where(partial, COVERAGE_PARTIAL, COVERAGE_NONE))
+
+
+def summarize_help_gaps(gaps, by):
+    """希望ごとの分析結果を集計する
+
+    Args:
+        gaps (pd.DataFrame): analyze_help_gaps() の結果
+        by (str): 'store'（店舗ごと）、'area'（エリアごと）、'period'（16日始まりの期間ごと）
+
+    Returns:
+        pd.DataFrame: SUMMARY_COLUMNS の列を持つ集計結果
+    """
+    if by == 'period':
+        # 16日始まりの期間は、日付を15日戻した月で表せる
+        keys = (pd.DatetimeIndex(gaps['date']) - pd.Timedelta(days=PERIOD_START_DAY - 1)).to_period('M')
+    else:
+        keys = gaps[by]
+    summary = gaps.groupby(keys).agg(
+        requests=('help_time', 'size'),
+        requested_min=('requested_min', 'sum'),
+        covered_min=('covered_min', 'sum'),
+        uncovered_min=('uncovered_min', 'sum'),
+    )
+    return summary.rename_axis(by)[SUMMARY_COLUMNS]
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+from constants import EMPLOYEE_AREAS
+from help_gaps import analyze_help_gaps, coverage_status, COVERAGE_NONE
+from shift_record import ShiftRecord, Segment, STORE_AREAS
+
+# 勤務可能なシフト種類ごとの、ヘルプに入れる時間帯（0時からの分）
+AVAILABILITY_WINDOWS = {
+    'AM可': (0, 13 * 60),
+    'PM可': (13 * 60, 24 * 60),
+    '1日可': (0, 24 * 60),
+}
+# 割り当てのコストの重み
+AREA_COST = 2.0       # 従業員の担当エリア外の店舗に入る場合
+LOAD_COST = 1.0       # 勤務可能日数に対する、ヘルプに入っている日数の割合
+TIME_FIT_COST = 1.0   # 希望時間帯が勤務可能な時間帯からはみ出す1時間あたり
+# 割り当てられない組（勤務可能な時間帯と重ならない、すでに入っている時間帯と重なる）のコスト
+INFEASIBLE_COST = 1e6
+
+PLAN_COLUMNS = ['date', 'store', 'help_time', 'employee', 'area_cost', 'load_cost', 'time_cost', 'cost']
+# 従業員の担当エリア
+EMPLOYEE_AREA = {employee: area for area, employees in EMPLOYEE_AREAS.items() for employee in employees}
+
+
+def min_cost_matching(cost):
+    """コスト行列の行と列を1対1に対応させる最小コストのマッチング（ハンガリー法）を求める
+
+    行と列の数が異なる場合は、少ない方がすべて対応付けられる。
+
+    Args:
+        cost (np.ndarray): 行×列のコスト
+
+    Returns:
+        list: 対応付けた (行, 列) のリスト
+    """
+    cost = np.asarray(cost, dtype=float)
+    if cost.size == 0:
+        return []
+    if cost.shape[0] > cost.shape[1]:
+        return [(row, column) for column, row in min_cost_matching(cost.T)]
+
+    # ポテンシャル u, v を使う O(n^2 m) の実装（添字0は番兵）。列方向の更新はNumPyでまとめて行う
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    matched_row = np.zeros(m + 1, dtype=int)
+    way = np.zeros(m + 1, dtype=int)
+    for row in range(1, n + 1):
+        matched_row[0] = row
+        column = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = matched_row[column]
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            better = ~used[1:] & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(used[1:], np.inf, min_reduced[1:])
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            u[matched_row[used]] += delta
+            v[used] -= delta
+            min_reduced[~used] -= delta
+            column = next_column
+            if matched_row[column] == 0:
+                break
+        # 増加路に沿って対応を付け替える
+        while column:
+            previous = way[column]
+            matched_row[column] = matched_row[previous]
+            column = previous
+    return [(matched_row[column] - 1, column - 1) for column in range(1, m + 1) if matched_row[column]]
+
+
+def plan_help_assignments(shift_data, store_help_requests, assignment_index, shift_type_codes, stores=None):
+    """誰も入っていない店舗ヘルプ希望に、勤務可能な従業員を割り当てる案を作る
+
+    日付ごとに、希望と勤務可能（AM可・PM可・1日可）な従業員の二部グラフを作り、
+    エリアの違い・ヘルプの負荷・時間帯の合い方のコストが最小になるマッチングを求める。
+    1人の従業員は1日に1件まで。負荷は日付順に、前の日までの割り当て案も含めて数える。
+
+    Args:
+        shift_data (pd.DataFrame): 日付×従業員のシフト
+        store_help_requests (pd.DataFrame): 日付×店舗の希望時間帯
+        assignment_index (StoreAssignmentIndex): (日付, 店舗) の逆引きインデックス
+        shift_type_codes (ShiftTypeCodes): シフト種類のコード（勤務可能日数に使う）
+        stores (list): 対象の店舗（省略時はピボットのすべての店舗）
+
+    Returns:
+        pd.DataFrame: PLAN_COLUMNS の列を持つ割り当て案
+    """
+    gaps = analyze_help_gaps(store_help_requests, assignment_index, stores)
+    # ヘルプ希望の表で塗られていない（どの分も覆われておらず、時間を解析できない担当もいない）希望だけを対象にする
+    open_requests = gaps[coverage_status(gaps) == COVERAGE_NONE]
+    if open_requests.empty:
+        return pd.DataFrame(columns=PLAN_COLUMNS)
+
+    employees = list(shift_data.columns)
+    employee_areas = np.array([EMPLOYEE_AREA.get(employee) for employee in employees], dtype=object)
+    shift_days = shift_type_codes.employee_counts().reindex(employees, fill_value=0.0).to_numpy()
+    records = shift_data.map(ShiftRecord.of)
+    # ヘルプに入っている日数（割り当て案の分は日付順に足していく）
+    help_days = records.map(lambda record: any(record.stores)).sum().to_numpy(dtype=float)
+
+    plan = []
+    for date, requests in open_requests.groupby('date', sort=True):
+        if date not in records.index:
+            continue
+        day = records.loc[date]
+        available = [i for i, record in enumerate(day) if record.type in AVAILABILITY_WINDOWS]
+        if not available:
+            continue
+        request_starts = requests['start_min'].to_numpy()
+        request_ends = requests['end_min'].to_numpy()
+
+        window_starts = np.array([AVAILABILITY_WINDOWS[day.iat[i].type][0] for i in available])[:, None]
+        window_ends = np.array([AVAILABILITY_WINDOWS[day.iat[i].type][1] for i in available])[:, None]
+        overlap = np.maximum(np.minimum(window_ends, request_ends) - np.maximum(window_starts, request_starts), 0)
+        time_cost = TIME_FIT_COST * ((request_ends - request_starts) - overlap) / 60
+        area_cost = AREA_COST * (employee_areas[available][:, None] != requests['store'].map(STORE_AREAS).to_numpy())
+        load_cost = np.repeat((LOAD_COST * help_days[available] / np.maximum(shift_days[available], 1))[:, None], len(requests), axis=1)
+
+        # 勤務可能な時間帯と重ならない組と、すでに入っている時間帯と重なる組は割り当てない
+        infeasible = overlap == 0
+        for row, i in enumerate(available):
+            for segment in day.iat[i].segments:
+                if segment.is_time_valid and segment.end_min is not None:
+                    infeasible[row] |= (segment.start_min < request_ends) & (request_starts < segment.end_min)
+        cost = np.where(infeasible, INFEASIBLE_COST, area_cost + load_cost + time_cost)
+
+        for row, column in min_cost_matching(cost):
+            if infeasible[row, column]:
+                continue
+            i = available[row]
+            help_days[i] += 1
+            request = requests.iloc[column]
+            plan.append((
+                date, request['store'], request['help_time'], employees[i],
+                area_cost[row, column], load_cost[row, column], time_cost[row, column], cost[row, column]
+            ))
+    return pd.DataFrame(plan, columns=PLAN_COLUMNS)
+
+
+def plan_shift_updates(plan, shift_data, store_help_requests, assignment_index):
+    """割り当て案を、適用時点のシフトとヘルプ希望で確かめ直してから (日付, 従業員, シフト文字列) のリストに変換する
+
+    案を作った後にシフトやヘルプ希望が変わり、次のどれかに当てはまる行は適用しない。
+    - 従業員のシフト種類が勤務可能（AM可・PM可・1日可）でなくなった
+    - 希望の時間帯が、その日の従業員のほかの時間帯と重なる
+    - 希望の時間帯が変わった、またはほかの担当ですでに覆われている
+
+    Args:
+        plan (pd.DataFrame): plan_help_assignments() の割り当て案
+        shift_data (pd.DataFrame): 適用時点の日付×従業員のシフト
+        store_help_requests (pd.DataFrame): 適用時点の日付×店舗の希望時間帯
+        assignment_index (StoreAssignmentIndex): 適用時点の (日付, 店舗) の逆引きインデックス
+
+    Returns:
+        tuple: (更新のリスト, 適用しなかった (日付, 店舗, 従業員, 理由) のリスト)
+    """
+    gaps = analyze_help_gaps(store_help_requests, assignment_index, sorted(set(plan['store'])))
+    open_requests = {
+        (date, store): help_time
+        for date, store, help_time, status in zip(gaps['date'], gaps['store'], gaps['help_time'], coverage_status(gaps))
+        if status == COVERAGE_NONE
+    }
+
+    updates = []
+    skipped = []
+    for date, employee, store, help_time in zip(plan['date'], plan['employee'], plan['store'], plan['help_time']):
+        if date not in shift_data.index or employee not in shift_data.columns:
+            skipped.append((date, store, employee, '期間外の日付か、従業員がいません'))
+            continue
+        record = ShiftRecord.of(shift_data.at[date, employee])
+        segment = Segment(help_time, store)
+        if record.type not in AVAILABILITY_WINDOWS:
+            skipped.append((date, store, employee, f'勤務可能なシフトではなくなりました（{record.type}）'))
+        elif any(
+            other.is_time_valid and other.end_min is not None
+            and other.start_min < segment.end_min and segment.start_min < other.end_min
+            for other in record.segments
+        ):
+            skipped.append((date, store, employee, 'その日のほかの時間帯と重なります'))
+        elif open_requests.get((date, store)) != help_time:
+            skipped.append((date, store, employee, 'ヘルプ希望が変わったか、すでに担当がいます'))
+        else:
+            segments = record.segments + (segment,)
+            updates.append((date, employee, ShiftRecord(record.type, record.note, segments).to_string()))
+    return updates, skipped
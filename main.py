@@ -1,83 +1,179 @@
 import streamlit as st
 st.set_page_config(layout="wide")
 
-@st.cache_data(ttl=3600)
+@st.cache_resource
+def get_change_feed():
+    # 他のユーザーによる変更を共有キャッシュに反映する変更フィード（プロセスにつき1つ）
+    return ShiftChangeFeed(get_db()).start()
+
 def get_cached_shifts(year, month):
-    start_date = pd.Timestamp(year, month, 16)
-    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-    return db.get_shifts(start_date, end_date)
+    period = get_pay_period(year, month)
+    # 変更フィードが動いている間は共有キャッシュをそのまま使い、
+    # そうでなければ差分同期モードで更新された行だけを取得する
+    return db.sync_shifts(period.start, period.end, use_cache=get_change_feed().is_live())
 
 import pandas as pd
 from datetime import datetime
 import io
 import base64
 import asyncio
-from database import db
+import threading
+import logging
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from database import db, get_db
+from async_database import get_async_db
+from change_feed import ShiftChangeFeed
+from write_queue import get_write_queue
 from pdf_generator import generate_help_table_pdf, generate_individual_pdf, generate_store_pdf
-from constants import EMPLOYEES, EMPLOYEE_AREAS, SHIFT_TYPES, STORE_COLORS, WEEKDAY_JA, AREAS
-from utils import parse_shift, format_shifts, update_session_state_shifts, highlight_weekend_and_holiday, highlight_filled_shifts
+from constants import EMPLOYEES, EMPLOYEE_AREAS, SHIFT_TYPES, STORE_COLORS, AREAS
+from shift_record import ShiftRecord, Segment, EMPTY_SHIFT, is_valid_time_range, parse_cache_stats
+from assignment_index import StoreAssignmentIndex
+from shift_counts import ShiftTypeCodes
+from conflicts import ConflictDetector, describe_conflict
+from help_gaps import analyze_help_gaps, summarize_help_gaps
+from help_solver import plan_help_assignments, plan_shift_updates
+from render_cache import get_fragment_cache, frame_fingerprint
+from table_renderer import render_shift_table, SHIFT_TABLE_CSS
+from pay_period import get_pay_period, pay_period_of
+from utils import ALL_STORES, update_session_state_shifts, set_session_shift, bump_shift_data_version, get_assignment_index, get_shift_type_codes, get_conflict_detector, highlight_weekend_and_holiday, weekend_and_holiday_css, compute_help_coverage, highlight_help_coverage
+
+logger = logging.getLogger(__name__)
 
 async def save_shift_async(date, employee, shift_str, repeat_weekly=False, selected_dates=None):
-    if not repeat_weekly:
-        await asyncio.to_thread(db.save_shift, date, employee, shift_str)
-    else:
-        # 選択された日付のみ保存
-        for target_date in selected_dates:
-            await asyncio.to_thread(db.save_shift, target_date, employee, shift_str)
-    
-    current_month = date.replace(day=1)
-    next_month = current_month + pd.DateOffset(months=1)
-    previous_month = current_month - pd.DateOffset(months=1)
-    
-    # キャッシュをクリア
-    get_cached_shifts.clear()
-    get_cached_shifts(current_month.year, current_month.month)
-    get_cached_shifts(next_month.year, next_month.month)
-    get_cached_shifts(previous_month.year, previous_month.month)
+    # 書き込みキューに積んで画面には即座に反映し、保存はバックグラウンドでまとめて行う
+    target_dates = selected_dates if repeat_weekly else [date]
+    records = [(d, employee, shift_str) for d in target_dates]
+    get_write_queue().enqueue_shifts(records)
+    # 保存が確定したかどうかをリラン後に表示するため、書き込んだ内容を覚えておく
+    st.session_state.last_shift_save = records
+    for target_date in target_dates:
+        if target_date in st.session_state.shift_data.index:
+            set_session_shift(target_date, employee, shift_str)
+    st.session_state.editing_shift = False
     
+    # セッションのシフトには反映済みで、共有キャッシュの期間のピボットは保存が確定したときに
+    # 変更通知でそのセルだけパッチされるため、取得し直さずに1回だけリランする
     st.experimental_rerun()
 
+def prefetch_adjacent_periods(date, background=False):
+    """日付が属する期間の前後の期間のうち、まだ保持していない期間のシフトを範囲クエリで取得する
+
+    表示中の期間は取得せず、同期状態も置き換えない。前後の期間がどちらも保持済みなら何もしない。
+    取得に失敗した期間は先読み済みの印を外し、次のリランで取得し直す。
+    """
+    current_period = pay_period_of(date)
+    # バックグラウンドスレッドからも同じインスタンスに書き込めるよう、ここで取得しておく
+    shared_db = get_db()
+    prefetched = st.session_state.setdefault('prefetched_periods', set())
+    held = set(shared_db.shift_sync.keys()) | prefetched
+    missing = [
+        period for period in (current_period.offset(-1), current_period.offset(1))
+        if (period.start.strftime('%Y-%m-%d'), period.end.strftime('%Y-%m-%d')) not in held
+    ]
+    if not missing:
+        return
+    missing_keys = [(period.start.strftime('%Y-%m-%d'), period.end.strftime('%Y-%m-%d')) for period in missing]
+    # 取得中に次のリランが来ても同じ期間を重ねて取得しない
+    prefetched.update(missing_keys)
+
+    def fetch():
+        # スレッドにはセッションの実行コンテキストがないため、取得前に参照しておいた集合を直接更新する
+        if not shared_db.prefetch_shift_periods([(period.start, period.end) for period in missing], skip_cached=True):
+            prefetched.difference_update(missing_keys)
+
+    if background:
+        threading.Thread(target=fetch, daemon=True).start()
+    else:
+        fetch()
+
+async def load_period_data(year, month):
+    """期間のシフト（キャッシュ経由）と店舗ヘルプ希望を並行して取得する"""
+    period = get_pay_period(year, month)
+    ctx = get_script_run_ctx()
+
+    def load_shifts():
+        # st.cache_dataとst.errorを別スレッドから使うため、スクリプトの実行コンテキストを引き継ぐ
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return get_cached_shifts(year, month)
+
+    shifts, store_help_requests = await asyncio.gather(
+        asyncio.to_thread(load_shifts),
+        get_async_db().get_store_help_requests(period.start, period.end)
+    )
+    return shifts, store_help_requests
+
 def initialize_shift_data(year, month):
     if 'shift_data' not in st.session_state or st.session_state.current_year != year or st.session_state.current_month != month:
-        start_date = pd.Timestamp(year, month, 16)
-        end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-        date_range = pd.date_range(start=start_date, end=end_date)
         st.session_state.shift_data = pd.DataFrame(
-            index=date_range,
+            index=get_pay_period(year, month).dates,
             columns=EMPLOYEES,
-            data='-'
+            data=EMPTY_SHIFT
         )
         st.session_state.current_year = year
         st.session_state.current_month = month
+        bump_shift_data_version()
+        # 期間のシフトはすべて未入力から始まるため、逆引きインデックスとシフト種類のコードも空から作り直す
+        st.session_state.assignment_index = StoreAssignmentIndex()
+        st.session_state.shift_type_codes = ShiftTypeCodes(st.session_state.shift_data.index, EMPLOYEES)
+        st.session_state.conflict_detector = ConflictDetector()
+        st.session_state.merged_shifts_version = None
+
+def select_area_tab(areas, key):
+    """タブの代わりに表示するエリアを選ぶ（選択はセッション状態に保持され、選んだエリアだけを描画する）"""
+    return st.radio('エリア', areas, horizontal=True, key=key, label_visibility='collapsed')
+
+def next_area(areas, area):
+    # 次に開かれそうなエリアは、並び順で隣のエリアとする
+    return areas[(areas.index(area) + 1) % len(areas)]
+
+def prefetch_fragments(fragment_cache, fragments):
+    """(キー, 描画関数) の断片をバックグラウンドで描画キャッシュに入れておく
+
+    描画関数はスクリプトの実行コンテキストの外で動くため、st.session_state やStreamlitの
+    要素を使わず、必要なデータは呼び出し前に取得しておくこと。次のリランでその場で
+    書き換えられるデータ（セッション状態のシフトなど）は、複製か集計済みの結果を渡すこと。
+    """
+    def run():
+        for key, render in fragments:
+            try:
+                fragment_cache.prefetch(key, render)
+            except Exception:
+                logger.exception("Fragment prefetch failed: %s", key)
 
-def calculate_shift_count(shift_data):
-    def count_shift(shift):
-        if pd.isna(shift) or shift == '-':
-            return 0
-        shift_type = shift.split(',')[0] if ',' in shift else shift
-        if shift_type in ['1日可', '鹿屋', 'かご北', 'リクルート'] or shift_type.startswith('その他'):
-            return 1
-        elif shift_type in ['AM可', 'PM可']:
-            return 0.5
-        return 0
-
-    # 変更後 - map関数を使用
-    return shift_data.map(count_shift).sum()
+    threading.Thread(target=run, daemon=True).start()
 
 def display_shift_table(selected_year, selected_month):
-    start_date = pd.Timestamp(selected_year, selected_month, 16)
-    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-    
-    date_range = pd.date_range(start=start_date, end=end_date)
-    display_data = st.session_state.shift_data.loc[start_date:end_date].copy()
-    
-    for date in date_range:
-        if date not in display_data.index:
-            display_data.loc[date] = '-'
-    
-    display_data = display_data.sort_index()
-    display_data['日付'] = display_data.index.strftime('%Y-%m-%d')
-    display_data['曜日'] = display_data.index.strftime('%a').map(WEEKDAY_JA)
+    period = get_pay_period(selected_year, selected_month)
+    # 描画済みのHTMLは (期間, エリア, ページ, シフトのバージョン) ごとに再利用する
+    fragment_cache = get_fragment_cache()
+    shift_version = st.session_state.get('shift_data_version', 0)
+    shift_data = st.session_state.shift_data
+    shift_type_codes = get_shift_type_codes()
+    prepared = {}
+
+    def get_display_data():
+        # 期間のすべての日付を日付順に並べる（欠けている日付は未入力）。PDFを作るときだけ作る
+        if 'display_data' not in prepared:
+            display_data = shift_data.reindex(period.dates, fill_value=EMPTY_SHIFT)
+            display_data['日付'] = period.dates.strftime('%Y-%m-%d')
+            display_data['曜日'] = period.weekdays
+            prepared['display_data'] = display_data
+        return prepared['display_data']
+
+    def get_area_shift_counts():
+        # 全エリアの従業員のシフト日数を1回で集計する
+        if 'area_shift_counts' not in prepared:
+            prepared['area_shift_counts'] = shift_type_codes.area_counts(EMPLOYEE_AREAS)
+        return prepared['area_shift_counts']
+
+    def render_page(area_employees, start_idx, end_idx):
+        return render_shift_table(period, shift_data, area_employees, start_idx, end_idx)
+
+    def render_shift_count(area, area_employees):
+        shift_count_df = pd.DataFrame([get_area_shift_counts()[area]], columns=area_employees)
+        styled_shift_count = shift_count_df.style.format("{:.1f}")\
+                                               .set_properties(**{'class': 'shift-count'})
+        return styled_shift_count.hide(axis="index").to_html(escape=False)
     
     # スタイルの設定
     st.markdown("""
@@ -101,65 +197,113 @@ def display_shift_table(selected_year, selected_month):
     }
     </style>
     """, unsafe_allow_html=True)
+    # シフト表の店舗・シフト種類・土日祝日の色（セルごとのstyle属性の代わりにクラスで付ける）
+    st.markdown(f"<style>{SHIFT_TABLE_CSS}</style>", unsafe_allow_html=True)
 
-    # エリアタブの作成
-    tabs = st.tabs(list(EMPLOYEE_AREAS.keys()))
+    # エリアの選択（選択中のエリアだけを集計・描画する）
+    areas = list(EMPLOYEE_AREAS.keys())
+    area = select_area_tab(areas, key='shift_table_area')
+    area_employees = EMPLOYEE_AREAS[area]
     
-    for area, tab in zip(EMPLOYEE_AREAS.keys(), tabs):
-        with tab:
-            area_employees = EMPLOYEE_AREAS[area]
-            area_display_data = display_data[['日付', '曜日'] + area_employees]
-            
-            items_per_page = 15
-            total_pages = len(area_display_data) // items_per_page + (1 if len(area_display_data) % items_per_page > 0 else 0)
-            
-            if f'current_page_{area}' not in st.session_state:
-                st.session_state[f'current_page_{area}'] = 1
+    items_per_page = 15
+    total_pages = len(period.dates) // items_per_page + (1 if len(period.dates) % items_per_page > 0 else 0)
+    
+    if f'current_page_{area}' not in st.session_state:
+        st.session_state[f'current_page_{area}'] = 1
+
+    # ページネーション用のコントロール
+    col1, col2, col3 = st.columns([2,3,2])
+    with col1:
+        if st.button('◀◀ 最初', key=f'first_page_{area}'):
+            st.session_state[f'current_page_{area}'] = 1
+        if st.button('◀ 前へ', key=f'prev_page_{area}') and st.session_state[f'current_page_{area}'] > 1:
+            st.session_state[f'current_page_{area}'] -= 1
+    with col2:
+        st.write(f'ページ {st.session_state[f"current_page_{area}"]} / {total_pages}')
+    with col3:
+        if st.button('最後 ▶▶', key=f'last_page_{area}'):
+            st.session_state[f'current_page_{area}'] = total_pages
+        if st.button('次へ ▶', key=f'next_page_{area}') and st.session_state[f'current_page_{area}'] < total_pages:
+            st.session_state[f'current_page_{area}'] += 1
+
+    start_idx = (st.session_state[f'current_page_{area}'] - 1) * items_per_page
+    end_idx = start_idx + items_per_page
+    page = st.session_state[f'current_page_{area}']
+    
+    # テーブルの表示
+    page_html = fragment_cache.get_or_render(
+        ('shift_table', selected_year, selected_month, area, page, shift_version),
+        lambda: render_page(area_employees, start_idx, end_idx)
+    )
+    st.write(page_html, unsafe_allow_html=True)
+
+    # シフト日数の表示
+    st.markdown(f"### {area}のシフト日数")
+    shift_count_html = fragment_cache.get_or_render(
+        ('shift_count', selected_year, selected_month, area, shift_version),
+        lambda: render_shift_count(area, area_employees)
+    )
+    st.write(shift_count_html, unsafe_allow_html=True)
+
+    # 日別・店舗別の内訳（表示するときだけ集計する）
+    if st.checkbox('日別・店舗別の内訳を表示', key=f'shift_count_breakdown_{area}'):
+        daily_counts = shift_type_codes.daily_counts(area_employees).reindex(period.dates, fill_value=0.0)
+        daily_counts.insert(0, '曜日', period.weekdays)
+        daily_counts.index = period.dates.strftime('%Y-%m-%d')
+        st.markdown("#### 日別")
+        styled_daily_counts = daily_counts.style.format("{:.1f}", subset=area_employees)
+        st.write(styled_daily_counts.to_html(escape=False), unsafe_allow_html=True)
+        store_counts = shift_type_codes.store_counts(shift_data, area_employees)
+        st.markdown("#### 店舗別")
+        if store_counts.empty:
+            st.write("店舗に入っているシフトはありません。")
+        else:
+            st.write(store_counts.style.format("{:.1f}").to_html(escape=False), unsafe_allow_html=True)
+
+    # エリアごとのPDFダウンロードボタン
+    if st.button(f"{area}のヘルプ表をPDFでダウンロード", key=f'pdf_download_{area}'):
+        area_display_data = get_display_data()[['日付', '曜日'] + area_employees]
+        pdf = generate_help_table_pdf(area_display_data, selected_year, selected_month, area)
+        st.download_button(
+            label=f"{area}のヘルプ表PDFをダウンロード",
+            data=pdf,
+            file_name=f"{area}_{selected_year}_{selected_month}.pdf",
+            mime="application/pdf",
+            key=f'pdf_download_button_{area}'
+        )
 
-            # ページネーション用のコントロール
-            col1, col2, col3 = st.columns([2,3,2])
-            with col1:
-                if st.button('◀◀ 最初', key=f'first_page_{area}'):
-                    st.session_state[f'current_page_{area}'] = 1
-                if st.button('◀ 前へ', key=f'prev_page_{area}') and st.session_state[f'current_page_{area}'] > 1:
-                    st.session_state[f'current_page_{area}'] -= 1
-            with col2:
-                st.write(f'ページ {st.session_state[f"current_page_{area}"]} / {total_pages}')
-            with col3:
-                if st.button('最後 ▶▶', key=f'last_page_{area}'):
-                    st.session_state[f'current_page_{area}'] = total_pages
-                if st.button('次へ ▶', key=f'next_page_{area}') and st.session_state[f'current_page_{area}'] < total_pages:
-                    st.session_state[f'current_page_{area}'] += 1
-
-            start_idx = (st.session_state[f'current_page_{area}'] - 1) * items_per_page
-            end_idx = start_idx + items_per_page
-            page_display_data = area_display_data.iloc[start_idx:end_idx]
-            
-            # テーブルの表示
-            page_display_data = page_display_data.reset_index(drop=True)
-            styled_df = page_display_data.style.format(format_shifts, subset=area_employees)\
-                                            .apply(highlight_weekend_and_holiday, axis=1)
-            
-            st.write(styled_df.hide(axis="index").to_html(escape=False), unsafe_allow_html=True)
-
-            # シフト日数の表示
-            st.markdown(f"### {area}のシフト日数")
-            area_shift_counts = calculate_shift_count(area_display_data[area_employees])
-            shift_count_df = pd.DataFrame([area_shift_counts], columns=area_employees)
-            styled_shift_count = shift_count_df.style.format("{:.1f}")\
-                                                   .set_properties(**{'class': 'shift-count'})
-            st.write(styled_shift_count.hide(axis="index").to_html(escape=False), unsafe_allow_html=True)
-
-            # エリアごとのPDFダウンロードボタン
-            if st.button(f"{area}のヘルプ表をPDFでダウンロード", key=f'pdf_download_{area}'):
-                pdf = generate_help_table_pdf(area_display_data, selected_year, selected_month, area)
-                st.download_button(
-                    label=f"{area}のヘルプ表PDFをダウンロード",
-                    data=pdf,
-                    file_name=f"{area}_{selected_year}_{selected_month}.pdf",
-                    mime="application/pdf",
-                    key=f'pdf_download_button_{area}'
-                )
+    # 次のエリアの表示中のページとシフト日数をバックグラウンドで描画しておく
+    if st.session_state.get('prefetch_next_area'):
+        prefetch_area = next_area(areas, area)
+        prefetch_employees = EMPLOYEE_AREAS[prefetch_area]
+        prefetch_page = st.session_state.get(f'current_page_{prefetch_area}', 1)
+        prefetch_start = (prefetch_page - 1) * items_per_page
+        page_key = ('shift_table', selected_year, selected_month, prefetch_area, prefetch_page, shift_version)
+        count_key = ('shift_count', selected_year, selected_month, prefetch_area, shift_version)
+        if page_key not in fragment_cache or count_key not in fragment_cache:
+            # セッション状態のシフトと日数のコードは次のリランでその場で書き換えられるため、
+            # スレッドにはシフトの複製と、ここで集計しておいた日数だけを渡す
+            shift_snapshot = shift_data.copy()
+            get_area_shift_counts()
+            prefetch_fragments(fragment_cache, [
+                (page_key, lambda: render_shift_table(period, shift_snapshot, prefetch_employees, prefetch_start, prefetch_start + items_per_page)),
+                (count_key, lambda: render_shift_count(prefetch_area, prefetch_employees)),
+            ])
+
+def display_conflicts(selected_year, selected_month):
+    period = get_pay_period(selected_year, selected_month)
+    conflicts = get_conflict_detector().conflicts(period.start, period.end)
+
+    with st.expander(f'シフトの重複（{len(conflicts)}件）', expanded=bool(conflicts)):
+        if conflicts:
+            for conflict in conflicts:
+                st.write(describe_conflict(conflict))
+        else:
+            st.write("重複しているシフトはありません。")
+        # 取り込みなどでまとめて変更した場合に、期間全体を検査し直す
+        if st.button('期間全体を再チェック', key='rescan_conflicts'):
+            st.session_state.conflict_detector = ConflictDetector.from_shift_data(st.session_state.shift_data)
+            st.experimental_rerun()
 
 def initialize_session_state():
     if 'editing_shift' not in st.session_state:
@@ -171,6 +315,11 @@ def initialize_session_state():
     if 'help_selected_dates' not in st.session_state:
         st.session_state.help_selected_dates = {}
 
+def warn_invalid_time(time):
+    # 時間帯として読み取れない入力は、保存はできるが並び順や充足状況の判定に使えないため警告する
+    if time and not is_valid_time_range(time):
+        st.warning(f'「{time}」は時間帯として読み取れません（例: 9-12、9半-13、13:30-17）')
+
 def update_shift_input(current_shift, employee, date, selected_year, selected_month):
     initialize_session_state()
     
@@ -178,7 +327,8 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
         st.session_state.current_shift = current_shift
         st.session_state.editing_shift = True
     
-    shift_type, times, stores = parse_shift(st.session_state.current_shift)
+    record = ShiftRecord.of(st.session_state.current_shift)
+    shift_type, times, stores = record.type, record.times, record.stores
     
     # シフト種類選択
     new_shift_type = st.selectbox('種類', ['AM可', 'PM可', '1日可', '-', '休み', '鹿屋', 'かご北', 'リクルート', 'その他'], 
@@ -204,21 +354,19 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
             
             with col3:
                 time = st.text_input(f'時間 {i+1}', value=times[i] if i < len(times) else '')
+                warn_invalid_time(time)
             
             if time:
                 new_times.append(time)
                 new_stores.append(store)
         
-        if new_times:
-            new_shift_str = f"{new_shift_type},{','.join([f'{t}@{s}' if s else t for t, s in zip(new_times, new_stores)])}"
-        else:
-            new_shift_str = new_shift_type
+        new_shift_str = ShiftRecord(new_shift_type, None, map(Segment, new_times, new_stores)).to_string()
             
     elif new_shift_type == 'その他':
         # その他の内容を取得
-        if shift_type == 'その他' and times and not times[0].endswith('@'):
-            default_content = times[0]
-            shift_times = times[1:] if len(times) > 1 else []
+        if shift_type == 'その他' and record.note is not None:
+            default_content = record.note
+            shift_times = times
         else:
             default_content = ''
             shift_times = times
@@ -247,20 +395,19 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
                 
                 with col3:
                     time = st.text_input(f'時間 {i+1}', value=shift_times[i] if i < len(shift_times) else '', key=f'other_time_{i}')
+                    warn_invalid_time(time)
                 
                 if time:
                     new_times.append(time)
                     new_stores.append(store)
             
-            if other_content and new_times:
+            if other_content:
                 # その他の内容と時間/店舗情報を別々に保持
-                new_shift_str = f"その他,{other_content},{','.join([f'{t}@{s}' if s else t for t, s in zip(new_times, new_stores)])}"
-            elif other_content:
-                new_shift_str = f"その他,{other_content}"
+                new_shift_str = ShiftRecord('その他', other_content, map(Segment, new_times, new_stores)).to_string()
             else:
                 new_shift_str = 'その他'
         else:
-            new_shift_str = f"その他,{other_content}" if other_content else 'その他'
+            new_shift_str = ShiftRecord('その他', other_content or None).to_string()
             
     elif new_shift_type in ['休み', '鹿屋', 'かご北', 'リクルート', '-']:
         new_shift_str = new_shift_type
@@ -273,12 +420,10 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
     # 選択可能な日付のリストを作成
     selected_dates = []
     if repeat_weekly:
-        # 表示している期間の開始日と終了日を取得（選択された年月に基づく）
-        period_start = pd.Timestamp(selected_year, selected_month, 16)
-        period_end = (period_start + pd.DateOffset(months=1)) - pd.Timedelta(days=1)
-        
-        # 期間内のすべての日付を生成
-        dates = pd.date_range(start=period_start, end=period_end).tolist()
+        # 表示している期間（選択された年月に基づく）のすべての日付
+        period = get_pay_period(selected_year, selected_month)
+        dates = period.dates.tolist()
+        weekdays = dict(zip(dates, period.weekdays))
         
         if dates:
             st.write('登録する日付を選択:')
@@ -304,7 +449,7 @@ def update_shift_input(current_shift, employee, date, selected_year, selected_mo
             for d in dates:
                 date_str = d.strftime("%Y/%m/%d")
                 st.session_state.selected_dates[date_str] = st.checkbox(
-                    f'{date_str} ({WEEKDAY_JA[d.strftime("%a")]})', 
+                    f'{date_str} ({weekdays[d]})', 
                     value=st.session_state.selected_dates.get(date_str, True),
                     key=f'date_checkbox_{date_str}'
                 )
@@ -319,12 +464,10 @@ def register_store_help(help_date, store, help_time, selected_year, selected_mon
     
     selected_dates = []
     if repeat_weekly:
-        # 表示している期間の開始日と終了日を取得（選択された年月に基づく）
-        period_start = pd.Timestamp(selected_year, selected_month, 16)
-        period_end = (period_start + pd.DateOffset(months=1)) - pd.Timedelta(days=1)
-        
-        # 期間内のすべての日付を生成
-        dates = pd.date_range(start=period_start, end=period_end).tolist()
+        # 表示している期間（選択された年月に基づく）のすべての日付
+        period = get_pay_period(selected_year, selected_month)
+        dates = period.dates.tolist()
+        weekdays = dict(zip(dates, period.weekdays))
         
         if dates:
             st.write('登録する日付を選択:')
@@ -350,7 +493,7 @@ def register_store_help(help_date, store, help_time, selected_year, selected_mon
             for d in dates:
                 date_str = d.strftime("%Y/%m/%d")
                 st.session_state.help_selected_dates[date_str] = st.checkbox(
-                    f'{date_str} ({WEEKDAY_JA[d.strftime("%a")]})', 
+                    f'{date_str} ({weekdays[d]})', 
                     value=st.session_state.help_selected_dates.get(date_str, True),
                     key=f'help_date_checkbox_{date_str}'
                 )
@@ -360,37 +503,76 @@ def register_store_help(help_date, store, help_time, selected_year, selected_mon
     return repeat_weekly, selected_dates
 
 async def save_store_help_async(help_date, store, help_time, repeat_weekly=False, selected_dates=None):
-    if not repeat_weekly:
-        # 単一日付の登録
-        db.save_store_help_request(help_date, store, help_time)
-    else:
-        # 選択された日付すべてに登録
-        for target_date in selected_dates:
-            db.save_store_help_request(target_date, store, help_time)
+    # 書き込みキューに積み、保存はバックグラウンドでまとめて行う（表示には保存待ちの値を重ねる）
+    target_dates = selected_dates if repeat_weekly else [help_date]
+    get_write_queue().enqueue_store_help_requests([(d, store, help_time) for d in target_dates])
 
-def display_store_help_requests(selected_year, selected_month):
+def display_store_help_requests(selected_year, selected_month, store_help_requests):
     st.header('店舗ヘルプ希望')
     
-    start_date = pd.Timestamp(selected_year, selected_month, 16)
-    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-    
-    store_help_requests = db.get_store_help_requests(start_date, end_date)
-    
     if store_help_requests.empty:
         st.write("ヘルプ希望はありません。")
     else:
-        store_help_requests['日付'] = store_help_requests.index.strftime('%Y-%m-%d')
-        store_help_requests['曜日'] = store_help_requests.index.strftime('%a').map(WEEKDAY_JA)
-        
-        all_stores = [store for stores in AREAS.values() for store in stores]
-        for store in all_stores:
-            if store not in store_help_requests.columns:
-                store_help_requests[store] = '-'
-        
-        store_help_requests = store_help_requests.reset_index(drop=True)
+        period = get_pay_period(selected_year, selected_month)
+        # 描画済みのHTMLは、期間・シフトのバージョン・ヘルプ希望の内容が同じなら再利用する（充足状況はシフトで変わる）
+        fragment_cache = get_fragment_cache()
+        data_key = (selected_year, selected_month, st.session_state.get('shift_data_version', 0), frame_fingerprint(store_help_requests))
+        assignment_index = get_assignment_index()
+        prepared = {}
+
+        def prepare():
+            # キャッシュにない断片を描画するときだけ、表と充足状況をまとめて計算する
+            if not prepared:
+                help_table = store_help_requests.copy()
+                help_table['日付'] = help_table.index.strftime('%Y-%m-%d')
+                help_table['曜日'] = period.weekdays_of(help_table.index)
+                
+                for store in ALL_STORES:
+                    if store not in help_table.columns:
+                        help_table[store] = '-'
+                
+                # 希望時間帯のうち担当で埋まっていない分数（希望ごと）
+                prepared['help_gaps'] = analyze_help_gaps(help_table, assignment_index, ALL_STORES)
+                # 希望時間帯がどれだけ埋まっているかを、同じ分析結果から期間の全店舗分まとめて求める
+                prepared['coverage'] = compute_help_coverage(help_table, assignment_index, gaps=prepared['help_gaps'])
+                # 土日祝日の行の色も日付のあるうちに計算しておく
+                prepared['row_css'] = weekend_and_holiday_css(period, help_table.index)
+                prepared['help_table'] = help_table.reset_index(drop=True)
+            return prepared
+
+        def render_summary():
+            period_gaps = summarize_help_gaps(prepare()['help_gaps'], 'period')
+            if period_gaps.empty:
+                return ''
+            return f"期間の未充足: {format_minutes(period_gaps['uncovered_min'].sum())} / 希望: {format_minutes(period_gaps['requested_min'].sum())}"
+
+        def render_area(area_stores):
+            area_data = prepare()['help_table'][['日付', '曜日'] + area_stores]
+            area_data = area_data.fillna('-')
+
+            styled_df = area_data.style.apply(highlight_weekend_and_holiday, row_css=prepared['row_css'], axis=None)\
+                                    .apply(highlight_help_coverage, coverage=prepared['coverage'][area_stores], axis=None)
+            return styled_df.to_html(escape=False, index=False)
+
+        def render_area_gaps(area, area_stores):
+            help_gaps = prepare()['help_gaps']
+            store_gaps = summarize_help_gaps(help_gaps[help_gaps['area'] == area], 'store')
+            if store_gaps.empty:
+                return ''
+            store_gaps = store_gaps.reindex(area_stores).dropna()
+            gap_table = pd.DataFrame({
+                '店舗': store_gaps.index,
+                '希望件数': store_gaps['requests'].astype(int),
+                '希望時間': store_gaps['requested_min'].map(format_minutes),
+                '未充足': store_gaps['uncovered_min'].map(format_minutes),
+            })
+            return gap_table.to_html(escape=False, index=False)
+
+        summary = fragment_cache.get_or_render(('help_summary',) + data_key, render_summary)
+        if summary:
+            st.caption(summary)
 
         area_tabs = [area for area in AREAS.keys() if area != 'なし']
-        tabs = st.tabs(area_tabs)
         
         st.markdown("""
         <style>
@@ -410,22 +592,104 @@ def display_store_help_requests(selected_year, selected_month):
         </style>
         """, unsafe_allow_html=True)
         
-        for area, tab in zip(area_tabs, tabs):
-            with tab:
-                area_stores = AREAS[area]
-                area_data = store_help_requests[['日付', '曜日'] + area_stores]
-                area_data = area_data.fillna('-')
-
-                shift_data = st.session_state.shift_data[
-                    (st.session_state.shift_data.index >= start_date) & 
-                    (st.session_state.shift_data.index <= end_date)
-                ]
-                shift_data.index = pd.to_datetime(shift_data.index)
+        # エリアの選択（選択中のエリアだけを描画する）
+        area = select_area_tab(area_tabs, key='help_table_area')
+        area_stores = AREAS[area]
+        area_html = fragment_cache.get_or_render(('help_table', area) + data_key, lambda: render_area(area_stores))
+        st.write(area_html, unsafe_allow_html=True)
+
+        # 店舗ごとの未充足の時間
+        gaps_html = fragment_cache.get_or_render(('help_gaps', area) + data_key, lambda: render_area_gaps(area, area_stores))
+        if gaps_html:
+            st.markdown(f"#### {area}の未充足の時間")
+            st.write(gaps_html, unsafe_allow_html=True)
+
+        # 次のエリアの表をバックグラウンドで描画しておく
+        if st.session_state.get('prefetch_next_area'):
+            prefetch_area = next_area(area_tabs, area)
+            prefetch_stores = AREAS[prefetch_area]
+            table_key = ('help_table', prefetch_area) + data_key
+            gaps_key = ('help_gaps', prefetch_area) + data_key
+            if table_key not in fragment_cache or gaps_key not in fragment_cache:
+                # 逆引きインデックスは次のリランでその場で書き換えられるため、
+                # 充足状況はここで計算しておき、スレッドでは計算済みの結果から描画するだけにする
+                prepare()
+                prefetch_fragments(fragment_cache, [
+                    (table_key, lambda: render_area(prefetch_stores)),
+                    (gaps_key, lambda: render_area_gaps(prefetch_area, prefetch_stores)),
+                ])
+
+def display_help_plan(selected_year, selected_month, store_help_requests):
+    st.header('ヘルプ担当の自動割り当て')
+    st.write('誰も入っていないヘルプ希望に、勤務可能な従業員を割り当てる案を作成します。内容を確認してから適用してください。')
+
+    # 前回の適用結果（適用しなかった行は理由とともに表示する）
+    if 'help_plan_result' in st.session_state:
+        applied, skipped = st.session_state.pop('help_plan_result')
+        st.success(f'{applied}件の割り当てを適用しました')
+        for date, store, employee, reason in skipped:
+            st.warning(f"{date.strftime('%Y-%m-%d')} {store} {employee}さん: 適用しませんでした（{reason}）")
+
+    period = (selected_year, selected_month)
+    if st.button('割り当て案を作成', key='create_help_plan'):
+        st.session_state.help_plan = (period, plan_help_assignments(
+            st.session_state.shift_data, store_help_requests, get_assignment_index(), get_shift_type_codes(), ALL_STORES
+        ))
+
+    # 表示中の期間の割り当て案だけを扱う
+    plan_period, plan = st.session_state.get('help_plan', (None, None))
+    if plan is None or plan_period != period:
+        return
+    if plan.empty:
+        st.write("割り当てられるヘルプ希望はありません。")
+        return
+
+    plan_table = pd.DataFrame({
+        '日付': plan['date'].dt.strftime('%Y-%m-%d'),
+        '店舗': plan['store'],
+        '時間帯': plan['help_time'],
+        '担当': plan['employee'],
+        'コスト': plan['cost'].round(2),
+    })
+    st.write(plan_table.to_html(escape=False, index=False), unsafe_allow_html=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f'割り当て案を適用（{len(plan)}件）', key='apply_help_plan'):
+            # 適用時点のシフトとヘルプ希望で確かめ直し、時間帯と店舗を追加してまとめて1回の書き込みにする
+            updates, skipped = plan_shift_updates(plan, st.session_state.shift_data, store_help_requests, get_assignment_index())
+            if updates:
+                get_write_queue().enqueue_shifts(updates)
+            for date, employee, shift_str in updates:
+                set_session_shift(date, employee, shift_str)
+            del st.session_state.help_plan
+            st.session_state.help_plan_result = (len(updates), skipped)
+            st.experimental_rerun()
+    with col2:
+        if st.button('割り当て案を破棄', key='discard_help_plan'):
+            del st.session_state.help_plan
+            st.experimental_rerun()
 
-                styled_df = area_data.style.apply(highlight_weekend_and_holiday, axis=1)\
-                                        .apply(highlight_filled_shifts, shift_data=shift_data, axis=1)
+def display_debug_panel():
+    # URLに ?debug=1 を付けたときだけ表示する
+    if st.query_params.get('debug') != '1':
+        return
+    with st.sidebar.expander('デバッグ情報', expanded=True):
+        fragment_stats = get_fragment_cache().stats()
+        st.write(
+            f"描画キャッシュ: ヒット {fragment_stats['hits']} / ミス {fragment_stats['misses']} / 先読み {fragment_stats['prefetched']}"
+            f"（ヒット率 {fragment_stats['hit_rate']:.1%}、{fragment_stats['size']}/{fragment_stats['maxsize']}件保持）"
+        )
+        parse_stats = parse_cache_stats()
+        st.write(
+            f"シフト解析キャッシュ: ヒット {parse_stats['hits']} / ミス {parse_stats['misses']}"
+            f"（ヒット率 {parse_stats['hit_rate']:.1%}）"
+        )
+        st.write(f"シフトのバージョン: {st.session_state.get('shift_data_version', 0)}")
 
-                st.write(styled_df.to_html(escape=False, index=False), unsafe_allow_html=True)
+def format_minutes(minutes):
+    hours, minutes = divmod(int(minutes), 60)
+    return f'{hours}時間{minutes:02d}分'
 
 async def main():
     st.title('ヘルプ管理アプリ📝')
@@ -439,8 +703,49 @@ async def main():
         selected_month = st.selectbox('月を選択', range(1, 13), key='month_selector')
 
         initialize_shift_data(selected_year, selected_month)
-        shifts = get_cached_shifts(selected_year, selected_month)
+        shifts, store_help_requests = await load_period_data(selected_year, selected_month)
         update_session_state_shifts(shifts)
+        # 前後の期間は、まだ保持していなければバックグラウンドで先読みしておく
+        prefetch_adjacent_periods(get_pay_period(selected_year, selected_month).start, background=True)
+
+        # 保存待ちの変更は取得したデータより新しいため、その上に重ねて表示する
+        write_queue = get_write_queue()
+        period = get_pay_period(selected_year, selected_month)
+        for pending_date, pending_employee, pending_shift in write_queue.pending_records('shifts'):
+            if pd.Timestamp(pending_date) in st.session_state.shift_data.index:
+                set_session_shift(pd.Timestamp(pending_date), pending_employee, pending_shift)
+        store_help_requests = write_queue.overlay(store_help_requests.copy(), 'store_help_requests', period.start, period.end)
+
+        # 再試行しても保存できなかった変更は、画面上も取得したデータの値に戻す（このセッションでまだ戻していない分だけ）
+        failed_shifts, failure_seq = write_queue.failed_since('shifts', st.session_state.get('seen_write_failure_seq', 0))
+        for failed_date, failed_employee, _ in failed_shifts:
+            failed_date = pd.Timestamp(failed_date)
+            if failed_date in st.session_state.shift_data.index:
+                fetched = shifts.at[failed_date, failed_employee] if failed_date in shifts.index and failed_employee in shifts.columns else None
+                set_session_shift(failed_date, failed_employee, EMPTY_SHIFT if fetched is None or pd.isna(fetched) else fetched)
+        st.session_state.seen_write_failure_seq = failure_seq
+
+        queue_stats = write_queue.stats()
+        st.caption(f"保存待ち: {queue_stats['pending']}件 / 保存失敗: {queue_stats['failed']}件")
+        failed_shifts = write_queue.failed_records('shifts')
+        if failed_shifts:
+            st.error('保存できなかったため、次のシフトは元に戻しています:\n' + '\n'.join(
+                f"- {pd.Timestamp(failed_date).strftime('%Y-%m-%d')} {failed_employee}さん（{failed_shift}）"
+                for failed_date, failed_employee, failed_shift in failed_shifts
+            ))
+        failed_help_requests = write_queue.failed_records('store_help_requests')
+        if failed_help_requests:
+            st.error('保存できなかったため、次のヘルプ希望は表示していません:\n' + '\n'.join(
+                f"- {pd.Timestamp(failed_date).strftime('%Y-%m-%d')} {failed_store}（{failed_help_time}）"
+                for failed_date, failed_store, failed_help_time in failed_help_requests
+            ))
+        st.checkbox('次のエリアの表を先読みする', key='prefetch_next_area')
+        if queue_stats['failed'] and st.button('保存に失敗した変更を再試行'):
+            # 再試行したシフトも、保存が確定したかどうかを表示する
+            if failed_shifts:
+                st.session_state.last_shift_save = failed_shifts
+            write_queue.retry_failed()
+            st.experimental_rerun()
 
         st.header('シフト登録/修正')
         
@@ -448,10 +753,10 @@ async def main():
         area = st.selectbox('エリアを選択', list(EMPLOYEE_AREAS.keys()), key='employee_area_selector')
         employee = st.selectbox('従業員を選択', EMPLOYEE_AREAS[area])
         
-        start_date = datetime(selected_year, selected_month, 16)
-        end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-        default_date = max(min(datetime.now().date(), end_date.date()), start_date.date())
-        date = st.date_input('日付を選択', min_value=start_date.date(), max_value=end_date.date(), value=default_date)
+        start_date = period.start.date()
+        end_date = period.end.date()
+        default_date = max(min(datetime.now().date(), end_date), start_date)
+        date = st.date_input('日付を選択', min_value=start_date, max_value=end_date, value=default_date)
         
         if not isinstance(st.session_state.shift_data.index, pd.DatetimeIndex):
             st.session_state.shift_data.index = pd.to_datetime(st.session_state.shift_data.index)
@@ -461,9 +766,9 @@ async def main():
         if date in st.session_state.shift_data.index:
             current_shift = st.session_state.shift_data.loc[date, employee]
             if pd.isna(current_shift) or isinstance(current_shift, (int, float)):
-                current_shift = '休み'
+                current_shift = ShiftRecord('休み')
         else:
-            current_shift = '休み'
+            current_shift = ShiftRecord('休み')
         
         if 'last_employee' not in st.session_state or 'last_date' not in st.session_state or \
            st.session_state.last_employee != employee or st.session_state.last_date != date:
@@ -476,22 +781,33 @@ async def main():
 
         if st.button('保存'):
             await save_shift_async(date, employee, new_shift_str, repeat_weekly, selected_dates)
-            st.session_state.shift_data.loc[date, employee] = new_shift_str
-            if repeat_weekly and selected_dates:
-                for next_date in selected_dates:
-                    if next_date in st.session_state.shift_data.index:
-                        st.session_state.shift_data.loc[next_date, employee] = new_shift_str
-            st.session_state.editing_shift = False
-            st.success('保存しました')
-            st.experimental_rerun()
+
+        # 直前に保存したシフトの状態（保存はバックグラウンドで行うため、確定したかどうかをここで知らせる）
+        last_shift_save = st.session_state.get('last_shift_save')
+        if last_shift_save:
+            statuses = write_queue.status('shifts', last_shift_save)
+            if 'pending' in statuses:
+                st.info('シフトを保存しています（次の操作で結果を表示します）')
+            else:
+                # 結果は1回だけ表示する
+                del st.session_state.last_shift_save
+                if 'failed' in statuses:
+                    st.error('シフトを保存できませんでした')
+                else:
+                    st.success('保存しました')
+
+        # 選択中のセルに関係する重複（保存時にこのセルだけ検査し直している）
+        for conflict in get_conflict_detector().conflicts_for(date, employee):
+            st.warning(describe_conflict(conflict))
 
         st.header('店舗ヘルプ希望登録/修正')
         area = st.selectbox('エリアを選択', [key for key in AREAS.keys() if key != 'なし'], key='help_area')
         store = st.selectbox('店舗を選択', AREAS[area], key='help_store')
-        help_default_date = max(min(datetime.now().date(), end_date.date()), start_date.date())
+        help_default_date = max(min(datetime.now().date(), end_date), start_date)
         
-        help_date = st.date_input('日付を選択', min_value=start_date.date(), max_value=end_date.date(), value=help_default_date, key='help_date')
+        help_date = st.date_input('日付を選択', min_value=start_date, max_value=end_date, value=help_default_date, key='help_date')
         help_time = st.text_input('時間帯')
+        warn_invalid_time(help_time)
         
         # 繰り返し登録のオプションを追加
         repeat_weekly, selected_dates = register_store_help(pd.Timestamp(help_date), store, help_time, selected_year, selected_month)
@@ -509,9 +825,7 @@ async def main():
         if st.button('PDFを生成'):
             employee_data = st.session_state.shift_data[selected_employee]
             pdf_buffer = generate_individual_pdf(employee_data, selected_employee, selected_year, selected_month)
-            start_date = pd.Timestamp(selected_year, selected_month, 16)
-            end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-            file_name = f'{selected_employee}さん_{start_date.strftime("%Y年%m月%d日")}～{end_date.strftime("%Y年%m月%d日")}_シフト.pdf'
+            file_name = f'{selected_employee}さん_{period.start.strftime("%Y年%m月%d日")}～{period.end.strftime("%Y年%m月%d日")}_シフト.pdf'
             st.download_button(
                 label=f"{selected_employee}さんのPDFをダウンロード",
                 data=pdf_buffer.getvalue(),
@@ -523,26 +837,22 @@ async def main():
         selected_area = st.selectbox('エリアを選択', [key for key in AREAS.keys() if key != 'なし'], key='pdf_area_selector')
         selected_store = st.selectbox('店舗を選択', AREAS[selected_area], key='pdf_store_selector')
         if st.button('店舗PDFを生成'):
-            start_date = pd.Timestamp(selected_year, selected_month, 16)
-            end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-            
             # シフトデータの取得
             store_data = st.session_state.shift_data.copy()
             
             try:
-                # ヘルプ希望データの取得とデフォルト値の設定
-                store_help_requests = db.get_store_help_requests(start_date, end_date)
-                if store_help_requests.empty:
+                # 取得済みのヘルプ希望データにデフォルト値を設定
+                store_help_data = store_help_requests.copy()
+                if store_help_data.empty:
                     # ヘルプ希望データが空の場合、すべての日付で'-'を設定
-                    date_range = pd.date_range(start=start_date, end=end_date)
-                    store_help_requests = pd.DataFrame(index=date_range, columns=[selected_store])
-                    store_help_requests[selected_store] = '-'
-                elif selected_store not in store_help_requests.columns:
+                    store_help_data = pd.DataFrame(index=period.dates, columns=[selected_store])
+                    store_help_data[selected_store] = '-'
+                elif selected_store not in store_help_data.columns:
                     # 選択された店舗のデータが存在しない場合、'-'で列を追加
-                    store_help_requests[selected_store] = '-'
+                    store_help_data[selected_store] = '-'
                 
                 # シフトデータにヘルプ希望データを追加
-                store_data[selected_store] = store_help_requests[selected_store]
+                store_data[selected_store] = store_help_data[selected_store]
                 
                 # PDFの生成
                 pdf_buffer = generate_store_pdf(store_data, selected_store, selected_year, selected_month)
@@ -560,7 +870,10 @@ async def main():
                 st.error(f"PDFの生成中にエラーが発生しました。: {str(e)}")
 
     display_shift_table(selected_year, selected_month)
-    display_store_help_requests(selected_year, selected_month)
+    display_conflicts(selected_year, selected_month)
+    display_store_help_requests(selected_year, selected_month, store_help_requests)
+    display_help_plan(selected_year, selected_month, store_help_requests)
+    display_debug_panel()
 
 if __name__ == '__main__':
     if db.init_db():
@@ -0,0 +1,81 @@
+import functools
+import jpholiday
+import numpy as np
+import pandas as pd
+from constants import WEEKDAY_JA
+
+# 期間は毎月16日から翌月15日まで
+PERIOD_START_DAY = 16
+
+# 曜日番号（月曜=0）から日本語の曜日への対応
+WEEKDAY_LABELS = np.array([WEEKDAY_JA[day] for day in ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']])
+
+
+class PayPeriod:
+    """16日から翌月15日までの期間
+
+    日付の一覧・曜日・土日祝日の判定・月ごとの分割を作成時に一度だけ計算する。
+    get_pay_period() で年月ごとにメモ化された同じインスタンスを使うこと。
+    """
+    __slots__ = (
+        'year', 'month', 'start', 'end', 'dates', 'weekdays',
+        'is_saturday', 'is_sunday', 'is_holiday', 'month_ranges'
+    )
+
+    def __init__(self, year, month):
+        self.year = year
+        self.month = month
+        self.start = pd.Timestamp(year, month, PERIOD_START_DAY)
+        self.end = self.start + pd.DateOffset(months=1) - pd.Timedelta(days=1)
+        self.dates = pd.date_range(start=self.start, end=self.end)
+        self.weekdays = WEEKDAY_LABELS[self.dates.dayofweek]
+        self.is_saturday = np.asarray(self.dates.dayofweek == 5)
+        self.is_sunday = np.asarray(self.dates.dayofweek == 6)
+        holidays = [date for date, _ in jpholiday.between(self.start.date(), self.end.date())]
+        self.is_holiday = np.asarray(self.dates.isin(pd.DatetimeIndex(holidays)))
+        # PDFのヘルプ表はページを月ごとに分ける
+        next_month_start = pd.Timestamp(year, month, 1) + pd.DateOffset(months=1)
+        self.month_ranges = [
+            (self.start, next_month_start - pd.Timedelta(days=1)),
+            (next_month_start, self.end),
+        ]
+        for mask in (self.weekdays, self.is_saturday, self.is_sunday, self.is_holiday):
+            mask.flags.writeable = False
+
+    def offset(self, months):
+        """monthsか月前後の期間を返す"""
+        start = self.start + pd.DateOffset(months=months)
+        return get_pay_period(start.year, start.month)
+
+    def positions(self, dates):
+        """日付の期間内での位置を返す
+
+        期間外の日付があればKeyErrorを送出する（-1のまま配列を引くと、末尾の日の曜日や
+        土日祝日の判定が黙って使われてしまうため）。
+        """
+        dates = pd.DatetimeIndex(dates)
+        positions = self.dates.get_indexer(dates)
+        if (positions < 0).any():
+            outside = dates[positions < 0].strftime('%Y-%m-%d')
+            raise KeyError(f'{self!r} の期間外の日付です: {", ".join(outside[:5])}')
+        return positions
+
+    def weekdays_of(self, dates):
+        """期間内の日付の日本語の曜日を返す"""
+        return self.weekdays[self.positions(dates)]
+
+    def __repr__(self):
+        return f'PayPeriod({self.year}, {self.month})'
+
+
+@functools.lru_cache(maxsize=None)
+def get_pay_period(year, month):
+    """年月の期間（16日始まり）を返す"""
+    return PayPeriod(year, month)
+
+
+def pay_period_of(date):
+    """日付が属する期間を返す"""
+    date = pd.Timestamp(date)
+    period_start = date if date.day >= PERIOD_START_DAY else date - pd.DateOffset(months=1)
+    return get_pay_period(period_start.year, period_start.month)
@@ -1,5 +1,4 @@
 import io
-import pandas as pd
 from reportlab.lib import colors
 from reportlab.lib.colors import HexColor
 from reportlab.lib.pagesizes import landscape, A4
@@ -9,13 +8,13 @@ from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.colors import Color
-from constants import EMPLOYEE_AREAS,STORE_COLORS, WEEKDAY_JA, SATURDAY_BG_COLOR, SUNDAY_BG_COLOR, EMPLOYEES, HOLIDAY_BG_COLOR
+from constants import EMPLOYEE_AREAS,STORE_COLORS, SATURDAY_BG_COLOR, SUNDAY_BG_COLOR, EMPLOYEES, HOLIDAY_BG_COLOR
 from io import BytesIO
-from utils import parse_shift  # parse_shift関数をutils.pyからインポート
-from datetime import datetime
+from shift_record import ShiftRecord
 from reportlab.lib.enums import TA_CENTER
 from constants import HOLIDAY_BG_COLOR, KANOYA_BG_COLOR, KAGOKITA_BG_COLOR, DARK_GREY_TEXT_COLOR, SPECIAL_SHIFT_TYPES,RECRUIT_BG_COLOR
-import jpholiday
+from pay_period import get_pay_period
+import numpy as np
 
 # グローバルスコープでスタイルを定義
 styles = getSampleStyleSheet()
@@ -58,20 +57,19 @@ def hex_to_rgb(hex_color):
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) / 255.0 for i in (0, 2, 4))
 
-def format_shift_for_individual_pdf(shift_type, times, stores):
+def format_shift_for_individual_pdf(record):
     """
     シフトを個人PDF用にフォーマットする関数
     
     Args:
-        shift_type (str): シフトの種類 (AM可, PM可, 1日可, 休み など)
-        times (list): 時間のリスト
-        stores (list): 店舗のリスト
+        record (ShiftRecord): 解析済みのシフト
     
     Returns:
         list: Paragraphオブジェクトのリスト
     """
+    shift_type = record.type
     # シフトが空の場合の処理
-    if pd.isna(shift_type) or shift_type == '-' or isinstance(shift_type, (int, float)):
+    if record.is_empty:
         return [Paragraph('-', bold_style2)]
 
     # 特殊なシフトタイプの処理
@@ -94,15 +92,13 @@ def format_shift_for_individual_pdf(shift_type, times, stores):
                                    backColor=colors.HexColor(RECRUIT_BG_COLOR))
         
         formatted_shifts = []
-        if times:
+        if record.note is not None:
             # その他の内容を最初の要素として追加
-            content = times[0]
-            formatted_shifts.append(Paragraph(f'<b>その他: {content}</b>', other_style))
+            formatted_shifts.append(Paragraph(f'<b>その他: {record.note}</b>', other_style))
             
-            # 時間と店舗の情報を処理（2番目以降の要素）
-            for i in range(len(stores)):
-                time = times[i + 1] if i + 1 < len(times) else None
-                store = stores[i]
+            # 時間と店舗の情報を処理
+            for segment in record.segments:
+                time, store = segment.time, segment.store
                 if time and store:
                     color = STORE_COLORS.get(store, "#000000")
                     formatted_shifts.append(
@@ -118,7 +114,8 @@ def format_shift_for_individual_pdf(shift_type, times, stores):
     if shift_type in ['AM可', 'PM可', '1日可']:
         formatted_shifts = [Paragraph(f'<b>{shift_type}</b>', bold_style2)]
         
-        for time, store in zip(times, stores):
+        for segment in record.segments:
+            time, store = segment.time, segment.store
             if time and store:
                 color = STORE_COLORS.get(store, "#000000")
                 formatted_shifts.append(
@@ -166,14 +163,7 @@ def generate_help_table_pdf(data, year, month, area=None):
                                   fontSize=9,  # ヘッダーのフォントサイズを調整
                                   textColor=colors.white)
 
-    start_date = pd.Timestamp(year, month, 16)
-    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-    next_month_start = pd.Timestamp(year, month, 1) + pd.DateOffset(months=1)
-
-    date_ranges = [
-        (start_date, next_month_start - pd.Timedelta(days=1)),
-        (next_month_start, end_date)
-    ]
+    period = get_pay_period(year, month)
 
     # エリアに基づいて従業員リストを取得
     if area and area in EMPLOYEE_AREAS:
@@ -183,7 +173,7 @@ def generate_help_table_pdf(data, year, month, area=None):
         employees = EMPLOYEES
         title_prefix = ""
 
-    for i, (range_start, range_end) in enumerate(date_ranges):
+    for i, (range_start, range_end) in enumerate(period.month_ranges):
         if i > 0:
             elements.append(PageBreak())
 
@@ -192,6 +182,8 @@ def generate_help_table_pdf(data, year, month, area=None):
         elements.append(Spacer(1, 5*mm))
 
         filtered_data = data[(data.index >= range_start) & (data.index <= range_end)]
+        weekdays = period.weekdays_of(filtered_data.index)
+        row_colors = weekend_and_holiday_colors(period, filtered_data.index)
 
         table_data = [
             [
@@ -200,8 +192,7 @@ def generate_help_table_pdf(data, year, month, area=None):
             ] + [Paragraph(f'<font color="white"><b>{emp}</b></font>', header_style) for emp in employees]
         ]
 
-        for date, row in filtered_data.iterrows():
-            weekday = WEEKDAY_JA.get(date.strftime('%a'), date.strftime('%a'))
+        for (date, row), weekday in zip(filtered_data.iterrows(), weekdays):
             date_str = date.strftime('%Y-%m-%d')
             employee_shifts = [format_shift_for_pdf(row[emp]) for emp in employees]
             table_data.append([Paragraph(f'<b>{date_str}</b>', bold_style), Paragraph(f'<b>{weekday}</b>', bold_style)] + employee_shifts)
@@ -233,11 +224,9 @@ def generate_help_table_pdf(data, year, month, area=None):
         ])
 
         # 土日祝日の背景色
-        for i, (date, row) in enumerate(filtered_data.iterrows(), start=1):
-            if date.strftime('%a') == 'Sun' or jpholiday.is_holiday(date):
-                table_style.add('BACKGROUND', (0, i), (-1, i), colors.HexColor(HOLIDAY_BG_COLOR))
-            elif date.strftime('%a') == 'Sat':
-                table_style.add('BACKGROUND', (0, i), (-1, i), colors.HexColor(SATURDAY_BG_COLOR))
+        for i, color in enumerate(row_colors, start=1):
+            if color:
+                table_style.add('BACKGROUND', (0, i), (-1, i), colors.HexColor(color))
 
         table.setStyle(table_style)
         elements.append(table)
@@ -247,56 +236,65 @@ def generate_help_table_pdf(data, year, month, area=None):
     return buffer
 
 
+def weekend_and_holiday_colors(period, dates):
+    """期間内の日付ごとの行の背景色（日曜・祝日、土曜以外はNone）を返す"""
+    positions = period.positions(dates)
+    holiday = (period.is_sunday | period.is_holiday)[positions]
+    saturday = period.is_saturday[positions]
+    return np.where(holiday, HOLIDAY_BG_COLOR, np.where(saturday, SATURDAY_BG_COLOR, None)).tolist()
+
+
 def format_shift_for_pdf(shift):
-    if pd.isna(shift) or shift == '-':
+    record = ShiftRecord.of(shift)
+    if record.is_empty:
         return Paragraph('-', normal_style)
     
-    if shift == '休み':
+    if record.segments:
+        pass  # 時間・店舗がある場合は下の通常のシフトとして表示
+    elif record.type == '休み':
         return Paragraph('<b>休み</b>', ParagraphStyle('Holiday', 
                                                       parent=bold_style, 
                                                       textColor=colors.HexColor("#373737"),
                                                       backColor=colors.HexColor(HOLIDAY_BG_COLOR)))
-    if shift == '鹿屋':
+    elif record.type == '鹿屋':
         return Paragraph('<b>鹿屋</b>', ParagraphStyle('Kanoya', 
                                                       parent=bold_style, 
                                                       textColor=colors.HexColor("#373737"),
                                                       backColor=colors.HexColor(KANOYA_BG_COLOR)))
-    if shift == 'かご北':
+    elif record.type == 'かご北':
         return Paragraph('<b>かご北</b>', ParagraphStyle('Kagokita', 
                                                         parent=bold_style, 
                                                         textColor=colors.HexColor("#373737"),
                                                         backColor=colors.HexColor(KAGOKITA_BG_COLOR)))
-    if shift == 'リクルート':
+    elif record.type == 'リクルート':
         return Paragraph('<b>リクルート</b>', ParagraphStyle('Recruit', 
                                                         parent=bold_style, 
                                                         textColor=colors.HexColor("#373737"),
     
                                                         backColor=colors.HexColor(RECRUIT_BG_COLOR)))
     # その他の処理を追加
-    if isinstance(shift, str) and shift.startswith('その他'):
+    if record.type == 'その他':
         other_style = ParagraphStyle('Other', 
                                     parent=bold_style, 
                                     textColor=colors.HexColor("#373737"),
                                     backColor=colors.HexColor(RECRUIT_BG_COLOR))
-        if ',' in shift:
-            _, content = shift.split(',', 1)
+        if record.note is not None:
+            content = ','.join([record.note] + [segment.to_string() for segment in record.segments])
             return Paragraph(f'<b>その他: {content}</b>', other_style)
         return Paragraph('<b>その他</b>', other_style)
     
-    shift_parts = shift.split(',')
-    shift_type = shift_parts[0]
+    shift_type = record.type
     formatted_parts = []
 
     shift_type_color = "#595959" if shift_type in ['AM可', 'PM可', '1日可'] else "#373737"
     formatted_parts.append(Paragraph(f'<font color="{shift_type_color}"><b>{shift_type}</b></font>', bold_style))
     
-    for part in shift_parts[1:]:
-        if '@' in part:
-            time, store = part.split('@')
-            color = STORE_COLORS.get(store, "#373737")
-            formatted_parts.append(Paragraph(f'<font color="{color}"><b>{time}@{store}</b></font>', bold_style))
+    for segment in record.segments:
+        if segment.store:
+            color = STORE_COLORS.get(segment.store, "#373737")
+            formatted_parts.append(Paragraph(f'<font color="{color}"><b>{segment.time}@{segment.store}</b></font>', bold_style))
         else:
-            formatted_parts.append(Paragraph(f'<b>{part}</b>', bold_style))
+            formatted_parts.append(Paragraph(f'<b>{segment.time}</b>', bold_style))
     
     return formatted_parts
 
@@ -312,42 +310,32 @@ def generate_individual_pdf(data, employee, year, month):
     elements.append(title)
     elements.append(Spacer(1, 10))
 
-    start_date = pd.Timestamp(year, month, 16)
-    end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-    filtered_data = data[(data.index >= start_date) & (data.index <= end_date)]
+    period = get_pay_period(year, month)
+    filtered_data = data[(data.index >= period.start) & (data.index <= period.end)].map(ShiftRecord.of)
+    weekdays = period.weekdays_of(filtered_data.index)
+    row_colors = weekend_and_holiday_colors(period, filtered_data.index)
 
-    max_shifts = max(len(str(shift).split(',')) - 1 if pd.notna(shift) and ',' in str(shift) else 1 
-                    for shift in filtered_data if pd.notna(shift))
+    # 1行に並べるシフトの最大数（「その他」の内容も1列として数える）
+    max_shifts = max(max(len(record.segments) + (record.note is not None), 1) for record in filtered_data)
     
     col_widths = [20*mm, 15*mm] + [30*mm] * max_shifts
     
     table_data = [['日付', '曜日'] + [f'シフト{i+1}' for i in range(max_shifts)]]
     
-    for date, shift in filtered_data.items():
-        weekday = WEEKDAY_JA[date.strftime('%a')]
+    for (date, record), weekday in zip(filtered_data.items(), weekdays):
         
-        # シフトデータの処理
-        if pd.notna(shift) and shift != '-':
-            shift_str = str(shift)
-            shift_type, times, stores = parse_shift(shift_str)
-            
-            # その他の場合の特別処理
-            if shift_type == 'その他':
-                if '/' in shift_str and '@' in shift_str:
-                    # その他,ミラクリッド作成/16-18@ジャック のような形式の場合
-                    content = shift_str.split(',', 1)[1]  # ミラクリッド作成/16-18@ジャック の部分を取得
-                    formatted_shifts = [Paragraph(f'<b>その他: {content}</b>', 
-                                     ParagraphStyle('Other',
-                                                  parent=bold_style2,
-                                                  textColor=colors.HexColor(DARK_GREY_TEXT_COLOR),
-                                                  backColor=colors.HexColor(RECRUIT_BG_COLOR)))]
-                else:
-                    # その他,研修 のような形式の場合
-                    formatted_shifts = format_shift_for_individual_pdf(shift_type, times, stores)
-            else:
-                formatted_shifts = format_shift_for_individual_pdf(shift_type, times, stores)
+        # その他の場合の特別処理
+        shift_str = record.to_string()
+        if record.type == 'その他' and '/' in shift_str and '@' in shift_str:
+            # その他,ミラクリッド作成/16-18@ジャック のような形式の場合
+            content = shift_str.split(',', 1)[1]  # ミラクリッド作成/16-18@ジャック の部分を取得
+            formatted_shifts = [Paragraph(f'<b>その他: {content}</b>', 
+                             ParagraphStyle('Other',
+                                          parent=bold_style2,
+                                          textColor=colors.HexColor(DARK_GREY_TEXT_COLOR),
+                                          backColor=colors.HexColor(RECRUIT_BG_COLOR)))]
         else:
-            formatted_shifts = format_shift_for_individual_pdf('-', [], [])
+            formatted_shifts = format_shift_for_individual_pdf(record)
         
         row = [date.strftime('%m/%d'), weekday] + formatted_shifts + [''] * (max_shifts - len(formatted_shifts))
         table_data.append(row)
@@ -367,12 +355,9 @@ def generate_individual_pdf(data, employee, year, month):
         ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
     ])
 
-    for i, row in enumerate(table_data[1:], start=1):
-        date = pd.to_datetime(filtered_data.index[i-1])
-        if '日' in row[1] or jpholiday.is_holiday(date):
-            style.add('BACKGROUND', (0, i), (-1, i), colors.HexColor(HOLIDAY_BG_COLOR))
-        elif '土' in row[1]:
-            style.add('BACKGROUND', (0, i), (-1, i), colors.HexColor(SATURDAY_BG_COLOR))
+    for i, color in enumerate(row_colors, start=1):
+        if color:
+            style.add('BACKGROUND', (0, i), (-1, i), colors.HexColor(color))
 
     t.setStyle(style)
     elements.append(t)
@@ -380,32 +365,6 @@ def generate_individual_pdf(data, employee, year, month):
     buffer.seek(0)
     return buffer
 
-def time_to_minutes(time_str):
-    """時間文字列を分単位に変換"""
-    try:
-        if '-' in time_str:
-            start_time = time_str.split('-')[0]
-        else:
-            start_time = time_str
-        
-        if '半' in start_time:
-            start_time = start_time.replace('半', ':30')
-        else:
-            start_time += ':00'
-        
-        try:
-            time_obj = datetime.strptime(start_time, '%H:%M')
-            return time_obj.hour * 60 + time_obj.minute
-        except ValueError:
-            # 数字だけの場合（例：'9'）は、':00'を追加して再試行
-            if start_time.isdigit():
-                time_obj = datetime.strptime(f"{start_time}:00", '%H:%M')
-                return time_obj.hour * 60 + time_obj.minute
-            raise
-    except:
-        # 時間の解析に失敗した場合は、非常に遅い時間として扱う
-        return 24 * 60  # 24:00 = 1440分
-
 def generate_store_pdf(store_data, selected_store, selected_year, selected_month):
     """店舗別のPDFを生成する関数"""
     buffer = io.BytesIO()
@@ -460,41 +419,31 @@ def generate_store_pdf(store_data, selected_store, selected_year, selected_month
     data = [[Paragraph(f'<b>{h}</b>', header_style) for h in header]]
     row_colors = [('BACKGROUND', (0, 0), (-1, 0), colors.grey)]
 
+    # 期間外の日付は表示しない（曜日と土日祝日は期間の計算済みの値を使う）
+    period = get_pay_period(selected_year, selected_month)
+    store_data = store_data[store_data.index.isin(period.dates)]
+    weekdays = period.weekdays_of(store_data.index)
+    day_colors = weekend_and_holiday_colors(period, store_data.index)
+
     # 各日付のデータを処理
-    for i, (date, row) in enumerate(store_data.iterrows(), start=1):
-        day_of_week = WEEKDAY_JA.get(date.strftime('%a'), date.strftime('%a'))
+    for i, ((date, row), day_of_week, color) in enumerate(zip(store_data.iterrows(), weekdays, day_colors), start=1):
         date_str = f"{date.strftime('%m月%d日')} {day_of_week}"
         shifts = []
 
         # 各従業員のシフトを処理
         for emp in EMPLOYEES:
-            shift = row.get(emp, '-')
-            if shift != '-' and not pd.isna(shift):
-                shift_type, shift_times, shift_stores = parse_shift(shift)
-                
-                if shift_type == 'その他':
-                    content = shift_times[0] if shift_times else ''  # その他の内容を保存
-                    # 時間と店舗の情報を処理（内容以降の部分）
-                    for j in range(len(shift_stores)):
-                        if shift_stores[j] == selected_store:
-                            try:
-                                time = shift_times[j + 1] if j + 1 < len(shift_times) else None
-                                if time:
-                                    minutes = time_to_minutes(time)
-                                    shifts.append((minutes, time, emp, content))
-                            except (ValueError, IndexError):
-                                continue
-                else:
-                    # 通常のシフト処理
-                    for time, store in zip(shift_times, shift_stores):
-                        if store == selected_store:
-                            try:
-                                minutes = time_to_minutes(time)
-                                shifts.append((minutes, time, emp, ''))
-                            except ValueError:
-                                continue
-
-        # 時間でソート
+            record = ShiftRecord.of(row.get(emp))
+            # その他の場合は内容を備考として表示
+            content = (record.note or '') if record.type == 'その他' else ''
+            for segment in record.segments:
+                if segment.store == selected_store and segment.time:
+                    if segment.is_time_valid:
+                        shifts.append(((0, segment.start_min), segment.time, emp, content))
+                    else:
+                        # 時間帯として読み取れないものは、その旨を表示して最後に並べる
+                        shifts.append(((1, 0), f'{segment.time}（時間不明）', emp, content))
+
+        # 開始時刻でソート
         shifts.sort(key=lambda x: x[0])
         
         if shifts:
@@ -516,10 +465,8 @@ def generate_store_pdf(store_data, selected_store, selected_year, selected_month
         ])
 
         # 土日祝日の背景色を設定
-        if day_of_week == '日' or jpholiday.is_holiday(date):
-            row_colors.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor(HOLIDAY_BG_COLOR)))
-        elif day_of_week == '土':
-            row_colors.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor(SATURDAY_BG_COLOR)))
+        if color:
+            row_colors.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor(color)))
 
     # テーブルスタイルの設定
     table = Table(data, colWidths=[80, 80, 80, 80])
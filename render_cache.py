@@ -0,0 +1,86 @@
+from collections import OrderedDict
+import threading
+import pandas as pd
+import streamlit as st
+
+# 保持する描画済みHTMLの数（4エリア×3ページのシフト表と5エリアのヘルプ表などを数バージョン分）
+FRAGMENT_CACHE_SIZE = 64
+
+
+class FragmentCache:
+    """描画済みのHTMLの断片を、(期間, エリア, ページ, データのバージョン) などのキーで保持するLRUキャッシュ
+
+    キーにはHTMLの内容を決めるものをすべて含めること。データが変わればバージョンが変わり、
+    古いキーの断片は使われなくなって順に追い出される。
+    先読みのスレッドからも書き込むため、保持している断片の操作はロックの中で行う（描画はロックの外）。
+    """
+
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._fragments
+
+    def get_or_render(self, key, render):
+        """キーの断片があればそれを、なければrender()で作って保持してから返す"""
+        with self._lock:
+            html = self._fragments.get(key)
+            if html is not None:
+                self.hits += 1
+                self._fragments.move_to_end(key)
+                return html
+            self.misses += 1
+        html = render()
+        self._store(key, html)
+        return html
+
+    def prefetch(self, key, render):
+        """キーの断片がなければrender()で作って保持しておく（ヒット・ミスには数えない）"""
+        with self._lock:
+            if key in self._fragments:
+                return
+        html = render()
+        with self._lock:
+            self.prefetched += 1
+        self._store(key, html)
+
+    def _store(self, key, html):
+        with self._lock:
+            self._fragments[key] = html
+            self._fragments.move_to_end(key)
+            if len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        """ヒット数・ミス数・ヒット率と保持している断片の数を返す"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'prefetched': self.prefetched,
+            'size': len(self._fragments),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+def get_fragment_cache():
+    """セッションごとの描画済みHTMLのキャッシュを返す"""
+    if 'fragment_cache' not in st.session_state:
+        st.session_state.fragment_cache = FragmentCache()
+    return st.session_state.fragment_cache
+
+
+def frame_fingerprint(frame):
+    """DataFrameの内容（列名・インデックス・値）から、キャッシュキーに使う値を作る"""
+    return tuple(frame.columns), int(pd.util.hash_pandas_object(frame, index=True).sum())
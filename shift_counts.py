@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+from shift_record import ShiftRecord, SHIFT_TYPE_NAMES, build_assignment_table
+
+# シフト日数として数える重み（ここにないシフト種類は0日）
+SHIFT_DAY_WEIGHTS = {
+    '1日可': 1.0,
+    'AM可': 0.5,
+    'PM可': 0.5,
+    'その他': 1.0,
+    '鹿屋': 1.0,
+    'かご北': 1.0,
+    'リクルート': 1.0,
+}
+# シフト種類のカテゴリ（コード0は未入力と未知のシフト種類）
+SHIFT_TYPE_CATEGORIES = ['-'] + SHIFT_TYPE_NAMES
+_category_codes = {name: code for code, name in enumerate(SHIFT_TYPE_CATEGORIES)}
+# カテゴリコードから重みを引く表
+WEIGHT_TABLE = np.array([SHIFT_DAY_WEIGHTS.get(name, 0.0) for name in SHIFT_TYPE_CATEGORIES])
+
+
+def shift_type_code(shift):
+    """シフト（文字列またはShiftRecord）のシフト種類のカテゴリコードを返す"""
+    return _category_codes.get(ShiftRecord.of(shift).type, 0)
+
+
+class ShiftTypeCodes:
+    """日付×従業員のシフト種類をカテゴリコードの配列で持ち、シフト日数をまとめて集計する
+
+    シフトのピボットと同じ形の配列をピボットと並べて保持し、セルが変わるたびに
+    update() でそのセルのコードだけを書き換える。日数は重みの表をコードで引いて
+    配列ごと合計するため、従業員・エリアの数によらず1回の集計で済む。
+    """
+
+    def __init__(self, index, columns, codes=None):
+        self.index = pd.DatetimeIndex(index)
+        self.columns = pd.Index(columns)
+        shape = (len(self.index), len(self.columns))
+        self.codes = np.zeros(shape, dtype=np.int8) if codes is None else codes
+
+    @classmethod
+    def from_shift_data(cls, shift_data):
+        """日付×従業員のシフトからコードの配列を作成する（同じシフトは種類ごとに1回だけ解析する）"""
+        cells, uniques = pd.factorize(shift_data.to_numpy().ravel())
+        # 欠損のセル（-1）は末尾に追加したコード0を引く
+        unique_codes = np.array([shift_type_code(value) for value in uniques] + [0], dtype=np.int8)
+        return cls(shift_data.index, shift_data.columns, unique_codes[cells].reshape(shift_data.shape))
+
+    def matches(self, shift_data):
+        """ピボットと同じ日付・従業員を持っているかどうか"""
+        return self.index.equals(pd.DatetimeIndex(shift_data.index)) and self.columns.equals(shift_data.columns)
+
+    def contains(self, date, employee):
+        return pd.Timestamp(date) in self.index and employee in self.columns
+
+    def update(self, date, employee, shift):
+        """セルのシフトが変わったときに、そのセルのコードを書き換える"""
+        self.codes[self.index.get_loc(pd.Timestamp(date)), self.columns.get_loc(employee)] = shift_type_code(shift)
+
+    def weights(self):
+        """日付×従業員のシフト日数（重み）の配列を返す"""
+        return WEIGHT_TABLE[self.codes]
+
+    def employee_counts(self):
+        """従業員ごとのシフト日数を返す"""
+        return pd.Series(self.weights().sum(axis=0), index=self.columns)
+
+    def area_counts(self, employee_areas):
+        """エリアごとの {エリア: 従業員ごとのシフト日数} を1回の集計から返す"""
+        counts = self.employee_counts()
+        return {area: counts.reindex(employees, fill_value=0.0) for area, employees in employee_areas.items()}
+
+    def daily_counts(self, employees=None):
+        """日付×従業員のシフト日数の内訳を返す（employeesを指定するとその従業員だけ）"""
+        daily = pd.DataFrame(self.weights(), index=self.index, columns=self.columns)
+        return daily if employees is None else daily.reindex(columns=employees, fill_value=0.0)
+
+    def store_counts(self, shift_data, employees=None):
+        """店舗×従業員のシフト日数の内訳を返す
+
+        1日に複数の店舗に入っている場合は、その日の日数を店舗の数で等分する。
+        店舗の入っていないシフト（休み、鹿屋など）は含めない。
+        """
+        columns = self.columns if employees is None else pd.Index(employees)
+        table = build_assignment_table(shift_data)
+        table = table[table['store'].notna() & (table['store'] != '')]
+        table = table.drop_duplicates(['date', 'employee', 'store'])
+        table = table[table['employee'].isin(self.columns) & pd.DatetimeIndex(table['date']).isin(self.index)]
+        if table.empty:
+            return pd.DataFrame(0.0, index=pd.Index([], name='store'), columns=columns)
+
+        rows = self.index.get_indexer(pd.DatetimeIndex(table['date']))
+        cols = self.columns.get_indexer(table['employee'])
+        stores_per_cell = table.groupby(['date', 'employee'])['store'].transform('size').to_numpy()
+        table = table.assign(weight=self.weights()[rows, cols] / stores_per_cell)
+        counts = table.pivot_table(index='store', columns='employee', values='weight', aggfunc='sum', fill_value=0.0)
+        return counts.reindex(columns=columns, fill_value=0.0)
@@ -0,0 +1,321 @@
+import functools
+import re
+import threading
+import numpy as np
+import pandas as pd
+from constants import AREAS
+
+# parse_shiftがシフト種類として認識する先頭要素
+SHIFT_TYPE_NAMES = ['AM可', 'PM可', '1日可', '休み', '鹿屋', 'かご北', 'リクルート', 'その他']
+# 時間・店舗を持たない単独のシフト
+SIMPLE_SHIFT_TYPES = ['休み', '鹿屋', 'かご北', 'リクルート']
+# 勤務可能なシフト
+WORK_SHIFT_TYPES = ['AM可', 'PM可', '1日可']
+OTHER_SHIFT_TYPE = 'その他'
+
+# 解析結果をキャッシュするシフト文字列の種類数（同じ文字列の繰り返しが多いため数千件で足りる）
+PARSE_CACHE_SIZE = 4096
+
+# 担当表（縦持ち）の列
+ASSIGNMENT_COLUMNS = ['date', 'employee', 'shift_type', 'note', 'slot', 'time_text', 'start_min', 'end_min', 'store', 'area']
+# 店舗名から所属エリアへの対応
+STORE_AREAS = {store: area for area, stores in AREAS.items() for store in stores}
+# 時間帯の書式（'9-12'・'9半-13'・'13:30-17'。終了時刻は省略可）
+_CLOCK = r'(?P<{0}_hour>\d{{1,2}})(?::(?P<{0}_minute>\d{{2}})|(?P<{0}_half>半))?'
+_TIME_RANGE_RE = re.compile(r'\s*{}\s*(?:-\s*{}\s*)?'.format(_CLOCK.format('start'), _CLOCK.format('end')))
+# 全角の数字・コロン・ハイフンと波ダッシュは半角にそろえてから解析する
+_TIME_TRANSLATION = str.maketrans('０１２３４５６７８９：－ー〜～', '0123456789:----')
+# 解析できない時間帯（時間帯として扱わない）
+INVALID_TIME_RANGE = (None, None)
+
+# 店舗名とIDの対応（定義済みの店舗を先頭に並べ、未知の店舗名は出現順に追加する）
+STORE_NAMES = [''] + [store for stores in AREAS.values() for store in stores]
+_store_ids = {name: i for i, name in enumerate(STORE_NAMES)}
+_store_lock = threading.Lock()
+
+
+def store_id(name):
+    """店舗名をIDに変換する（未知の店舗名は新しいIDを割り当てる）"""
+    store = _store_ids.get(name)
+    if store is None:
+        with _store_lock:
+            store = _store_ids.get(name)
+            if store is None:
+                store = len(STORE_NAMES)
+                STORE_NAMES.append(name)
+                _store_ids[name] = store
+    return store
+
+
+def _match_minutes(match, name):
+    hour = match[f'{name}_hour']
+    if hour is None:
+        return None
+    minute = 30 if match[f'{name}_half'] else int(match[f'{name}_minute'] or 0)
+    return int(hour) * 60 + minute
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_time_range(text):
+    """'9-12'・'9半-13'・'13:30-17' のような時間帯を (開始分, 終了分) に変換する
+
+    全角の数字も受け付ける。終了時刻がない場合（'9' など）は終了分がNone。
+    書式に合わない場合や、分が60以上・時刻が24時を超える場合は INVALID_TIME_RANGE を返す。
+    """
+    if not isinstance(text, str):
+        return INVALID_TIME_RANGE
+    match = _TIME_RANGE_RE.fullmatch(text.translate(_TIME_TRANSLATION))
+    if match is None:
+        return INVALID_TIME_RANGE
+    if any(int(match[f'{name}_minute'] or 0) >= 60 for name in ('start', 'end')):
+        return INVALID_TIME_RANGE
+    start_min, end_min = _match_minutes(match, 'start'), _match_minutes(match, 'end')
+    if start_min > 24 * 60 or (end_min is not None and end_min > 24 * 60):
+        return INVALID_TIME_RANGE
+    return start_min, end_min
+
+
+def is_valid_time_range(text):
+    """時間帯として解析できるかどうか"""
+    return parse_time_range(text) != INVALID_TIME_RANGE
+
+
+class _Immutable:
+    """生成後に属性を変更できないようにする基底クラス（解析結果はキャッシュで共有されるため）"""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+
+class Segment(_Immutable):
+    """シフトの1区間（時間帯と店舗）"""
+    __slots__ = ('start_min', 'end_min', 'store_id', 'time')
+
+    def __init__(self, time, store=''):
+        start_min, end_min = parse_time_range(time)
+        # timeは元の時間文字列（文字列形式に戻すときに使う）
+        object.__setattr__(self, 'time', time)
+        object.__setattr__(self, 'start_min', start_min)
+        object.__setattr__(self, 'end_min', end_min)
+        object.__setattr__(self, 'store_id', store_id(store))
+
+    @property
+    def store(self):
+        return STORE_NAMES[self.store_id]
+
+    @property
+    def is_time_valid(self):
+        """時間帯を解析できたかどうか（解析できた場合は開始分が必ずある）"""
+        return self.start_min is not None
+
+    def to_string(self):
+        return f'{self.time}@{self.store}' if self.store else self.time
+
+    def __eq__(self, other):
+        if not isinstance(other, Segment):
+            return NotImplemented
+        return self.time == other.time and self.store_id == other.store_id
+
+    def __hash__(self):
+        return hash((self.time, self.store_id))
+
+    def __reduce__(self):
+        return Segment, (self.time, self.store)
+
+    def __repr__(self):
+        return f'Segment({self.to_string()!r})'
+
+
+class ShiftRecord(_Immutable):
+    """1セル分のシフトを構造化したもの（変更不可）
+
+    type: シフト種類（'AM可'、'休み'、'その他' など。未入力は '-'）
+    note: 「その他」の内容（内容がない場合はNone）
+    segments: Segment のタプル
+    """
+    __slots__ = ('type', 'note', 'segments')
+
+    def __init__(self, type='-', note=None, segments=()):
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'note', note)
+        object.__setattr__(self, 'segments', tuple(segments))
+
+    @classmethod
+    def parse(cls, shift_str):
+        """シフト文字列（例: 'その他,研修,9-12@本店'）を解析する
+
+        同じ文字列の解析結果はLRUキャッシュから同じインスタンスを返す。
+        """
+        if not isinstance(shift_str, str) or shift_str in ('', '-'):
+            return EMPTY_SHIFT
+        return _parse_cached(shift_str)
+
+    @classmethod
+    def _parse(cls, shift_str):
+        if shift_str in SIMPLE_SHIFT_TYPES:
+            return cls(shift_str)
+
+        if shift_str.startswith(OTHER_SHIFT_TYPE):
+            parts = shift_str.split(',')
+            note = parts[1] if len(parts) > 1 else None
+            return cls(OTHER_SHIFT_TYPE, note, [_parse_segment(part) for part in parts[2:]])
+
+        parts = shift_str.split(',')
+        return cls(parts[0], None, [_parse_segment(part) for part in parts[1:]])
+
+    @classmethod
+    def of(cls, value):
+        """ShiftRecordはそのまま、文字列や欠損値は解析して返す"""
+        return value if isinstance(value, ShiftRecord) else cls.parse(value)
+
+    def to_string(self):
+        """保存用の文字列形式に戻す"""
+        if self.type == OTHER_SHIFT_TYPE:
+            if self.note is None:
+                return OTHER_SHIFT_TYPE
+            return ','.join([OTHER_SHIFT_TYPE, self.note] + [segment.to_string() for segment in self.segments])
+        return ','.join([self.type] + [segment.to_string() for segment in self.segments])
+
+    @property
+    def is_empty(self):
+        return self.type == '-' and not self.segments
+
+    @property
+    def is_filled(self):
+        """時間と店舗が登録されているかどうか（ヘルプが埋まっている判定に使う）"""
+        return bool(self.segments)
+
+    @property
+    def stores(self):
+        return [segment.store for segment in self.segments]
+
+    @property
+    def times(self):
+        return [segment.time for segment in self.segments]
+
+    def as_tuple(self):
+        """parse_shiftと同じ (シフト種類, 時間のリスト, 店舗のリスト) を返す
+
+        「その他」の場合は時間のリストの先頭に内容が入る。
+        """
+        if self.is_empty or (self.type in SIMPLE_SHIFT_TYPES and not self.segments):
+            return self.type, [], []
+        if self.type == OTHER_SHIFT_TYPE:
+            times = ([self.note] if self.note is not None else []) + self.times
+            return OTHER_SHIFT_TYPE, times, self.stores
+        shift_type = self.type if self.type in SHIFT_TYPE_NAMES else ''
+        return shift_type, self.times, self.stores
+
+    def __str__(self):
+        return self.to_string()
+
+    def __eq__(self, other):
+        if not isinstance(other, ShiftRecord):
+            return NotImplemented
+        return self.type == other.type and self.note == other.note and self.segments == other.segments
+
+    def __hash__(self):
+        return hash((self.type, self.note, self.segments))
+
+    def __reduce__(self):
+        # 復元時も解析キャッシュを通して同じインスタンスを共有する
+        return ShiftRecord.parse, (self.to_string(),)
+
+    def __repr__(self):
+        return f'ShiftRecord({self.to_string()!r})'
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_cached(shift_str):
+    return ShiftRecord._parse(shift_str)
+
+
+def parse_cache_stats():
+    """シフト文字列の解析キャッシュのヒット数・ミス数・ヒット率を返す"""
+    info = _parse_cached.cache_info()
+    total = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize,
+        'hit_rate': info.hits / total if total else 0.0,
+    }
+
+
+def _parse_segment(part):
+    time, _, store = part.strip().partition('@')
+    return Segment(time, store)
+
+
+EMPTY_SHIFT = ShiftRecord()
+
+
+def time_range_minutes(texts):
+    """時間帯のSeriesを (開始分, 終了分) のSeriesの組に変換する（解析できない場合は欠損）
+
+    同じ時間帯の文字列は種類ごとに1回だけ parse_time_range で解析する。
+    """
+    codes, uniques = pd.factorize(texts)
+    parsed = np.array([parse_time_range(text) for text in uniques] + [INVALID_TIME_RANGE], dtype=object).reshape(-1, 2)
+    start = pd.array(parsed[codes, 0], dtype='Int64')
+    end = pd.array(parsed[codes, 1], dtype='Int64')
+    return pd.Series(start, index=texts.index), pd.Series(end, index=texts.index)
+
+
+def _explode_shift_strings(strings):
+    """シフト文字列のSeriesを、文字列演算で1区間1行に展開する（インデックスは元の位置）"""
+    parts = strings.str.split(',')
+    is_other = strings.str.startswith(OTHER_SHIFT_TYPE)
+    table = pd.DataFrame({
+        'shift_type': parts.str[0].where(~is_other, OTHER_SHIFT_TYPE),
+        'note': parts.str[1].where(is_other),
+        # 「その他」は3番目以降、それ以外は2番目以降の要素が時間と店舗
+        'segment': parts.str[2:].where(is_other, parts.str[1:]),
+    })
+    table = table.explode('segment')
+    has_segment = table['segment'].notna()
+    table['slot'] = table.groupby(level=0).cumcount().where(has_segment).astype('Int64')
+
+    segments = table['segment'].str.strip().str.partition('@')
+    table['time_text'] = segments[0]
+    table['store'] = segments[2].where(has_segment)
+    table['start_min'], table['end_min'] = time_range_minutes(table['time_text'])
+    table['area'] = table['store'].map(STORE_AREAS)
+    return table.drop(columns='segment')
+
+
+def build_assignment_table(pivot):
+    """日付×従業員のシフトのピボットを、1区間1行の縦持ちの担当表に変換する
+
+    セル単位ではなく期間全体をまとめて処理する。同じシフト文字列は何度も現れるため、
+    文字列を種類ごとに番号付け（factorize）し、種類ごとにpandasの文字列演算で展開してから
+    番号で結合する。時間・店舗のないシフト（休み、AM可のみなど）はslotが欠損の1行になる。
+    未入力（'-'）のセルは含めない。
+
+    Args:
+        pivot (pd.DataFrame): 日付×従業員のシフト（文字列またはShiftRecord）
+
+    Returns:
+        pd.DataFrame: ASSIGNMENT_COLUMNS の列を持つ担当表
+    """
+    if pivot.empty:
+        return pd.DataFrame(columns=ASSIGNMENT_COLUMNS)
+
+    # stack()で欠損のセルは除かれる
+    cells = pivot.rename_axis(index='date', columns='employee').stack()
+    codes, uniques = pd.factorize(cells)
+    strings = pd.Series(uniques, dtype=object).astype(str)
+    strings = strings[~strings.isin(['', '-'])]
+    if strings.empty:
+        return pd.DataFrame(columns=ASSIGNMENT_COLUMNS)
+
+    parsed = _explode_shift_strings(strings)
+    keys = cells.index.to_frame(index=False)
+    keys['code'] = codes
+    table = keys.merge(parsed, left_on='code', right_index=True, sort=False)
+    return table[ASSIGNMENT_COLUMNS].reset_index(drop=True)
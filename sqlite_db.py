@@ -0,0 +1,223 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+import streamlit as st
+from database import BaseDB, BULK_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# (date, employee) と (date, store) は主キーとして一意インデックスが張られる
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shifts (
+    date TEXT NOT NULL,
+    employee TEXT NOT NULL,
+    shift TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (date, employee)
+);
+CREATE INDEX IF NOT EXISTS idx_shifts_updated_at ON shifts (updated_at);
+
+CREATE TABLE IF NOT EXISTS store_help_requests (
+    date TEXT NOT NULL,
+    store TEXT NOT NULL,
+    help_time TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (date, store)
+);
+
+CREATE TABLE IF NOT EXISTS cached_ranges (
+    table_name TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    PRIMARY KEY (table_name, start_date, end_date)
+);
+"""
+
+# テーブルごとのキー列と値列
+TABLE_COLUMNS = {
+    'shifts': ('employee', 'shift'),
+    'store_help_requests': ('store', 'help_time'),
+}
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SQLiteDB(BaseDB):
+    """SQLiteファイルを使うストレージバックエンド（オフライン・ベンチマーク用）"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        # Streamlitはセッションごとに別スレッドでスクリプトを実行するため、ロックで直列化する
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def init_db(self):
+        try:
+            with self._lock:
+                self.conn.executescript(SCHEMA)
+            return True
+        except Exception as e:
+            st.error(f"データベース接続エラー: {e}")
+            return False
+
+    def _fetch_rows(self, table, start_date_str, end_date_str, updated_since=None):
+        key_column, value_column = TABLE_COLUMNS[table]
+        sql = f"SELECT date, {key_column}, {value_column}, updated_at FROM {table} WHERE date >= ? AND date <= ?"
+        params = [start_date_str, end_date_str]
+        if updated_since is not None:
+            sql += " AND updated_at >= ?"
+            params.append(updated_since)
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def _fetch_shift_rows(self, start_date_str, end_date_str, updated_since=None, with_updated_at=False):
+        return self._fetch_rows('shifts', start_date_str, end_date_str, updated_since)
+
+    def _fetch_help_rows(self, start_date_str, end_date_str):
+        return self._fetch_rows('store_help_requests', start_date_str, end_date_str)
+
+    def upsert_rows(self, table, rows, updated_at=None):
+        """行をまとめてUpsertする（行にupdated_atがあればそれを優先）"""
+        key_column, value_column = TABLE_COLUMNS[table]
+        sql = f"""
+            INSERT INTO {table} (date, {key_column}, {value_column}, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (date, {key_column}) DO UPDATE SET
+                {value_column} = excluded.{value_column},
+                updated_at = excluded.updated_at
+        """
+        params = [
+            (row['date'], row[key_column], row[value_column], row.get('updated_at', updated_at))
+            for row in rows
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(sql, params)
+
+    def _upsert_in_chunks(self, table, rows, records):
+        """行をチャンクごとに1トランザクションでUpsertし、失敗した元レコードを返す"""
+        failed = []
+        for i in range(0, len(rows), BULK_CHUNK_SIZE):
+            chunk_rows = rows[i:i + BULK_CHUNK_SIZE]
+            chunk_records = records[i:i + BULK_CHUNK_SIZE]
+            try:
+                self.upsert_rows(table, chunk_rows, _now())
+            except Exception as e:
+                if not self._is_row_error(e):
+                    logger.warning("Upsert of %d rows failed on %s: %s", len(chunk_rows), table, e)
+                    failed.extend(chunk_records)
+                    continue
+                for row, record in zip(chunk_rows, chunk_records):
+                    try:
+                        self.upsert_rows(table, [row], _now())
+                    except Exception as e:
+                        logger.warning("Upsert failed on %s: %s. Error: %s", table, row, e)
+                        failed.append(record)
+        return failed
+
+    @staticmethod
+    def _is_row_error(error):
+        # 制約違反・値の不正は行によるもの。ロックやディスクのエラー（OperationalError）は行によらない
+        return isinstance(error, (sqlite3.IntegrityError, sqlite3.DataError))
+
+    def get_shift_version(self):
+        with self._lock:
+            return self.conn.execute("SELECT MAX(updated_at) FROM shifts").fetchone()[0]
+
+    def is_range_cached(self, table, start_date_str, end_date_str):
+        """期間が読み取りキャッシュとして取得済みかどうか"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM cached_ranges WHERE table_name = ? AND start_date <= ? AND end_date >= ?",
+                (table, start_date_str, end_date_str)
+            ).fetchone()
+        return row is not None
+
+    def mark_range_cached(self, table, start_date_str, end_date_str):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO cached_ranges (table_name, start_date, end_date) VALUES (?, ?, ?)",
+                (table, start_date_str, end_date_str)
+            )
+
+    def max_updated_at(self, table, start_date_str, end_date_str):
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT MAX(updated_at) FROM {table} WHERE date >= ? AND date <= ?",
+                (start_date_str, end_date_str)
+            ).fetchone()
+        return row[0]
+
+
+class SQLiteCachedDB(BaseDB):
+    """SQLiteをSupabaseの前段に置く読み取りキャッシュ
+
+    取得済みの期間はローカルの行に、前回以降にSupabaseで更新された行だけを
+    重ねて返す。Supabaseに接続できない場合はローカルの行で表示を続ける。
+    書き込みはSupabaseに送ったうえでローカルにも反映する。
+    """
+
+    def __init__(self, remote, local):
+        super().__init__()
+        self.remote = remote
+        self.local = local
+
+    def init_db(self):
+        local_ok = self.local.init_db()
+        try:
+            # テーブルの存在確認
+            self.remote.supabase.table('shifts').select("*").limit(1).execute()
+            return local_ok
+        except Exception as e:
+            logger.warning("Supabase unavailable, running on the local cache: %s", e)
+            st.warning(f"Supabaseに接続できません。ローカルキャッシュで動作します: {e}")
+            return local_ok
+
+    def _fetch_shift_rows(self, start_date_str, end_date_str, updated_since=None, with_updated_at=False):
+        remote_since = updated_since
+        cached = updated_since is None and self.local.is_range_cached('shifts', start_date_str, end_date_str)
+        if cached:
+            # 取得済みの期間はローカルの最高水位以降の差分だけをSupabaseから取得
+            remote_since = self.local.max_updated_at('shifts', start_date_str, end_date_str)
+        try:
+            rows = self.remote._fetch_shift_rows(start_date_str, end_date_str, remote_since, with_updated_at=True)
+        except Exception as e:
+            if not cached and updated_since is None:
+                raise
+            # 先読みや変更フィードのスレッドからも呼ばれ、そこではst.warningが表示されないためログにも出す
+            logger.warning("Supabase unavailable, serving %s - %s from the local cache: %s", start_date_str, end_date_str, e)
+            st.warning(f"Supabaseに接続できません。ローカルキャッシュのデータを表示しています: {e}")
+            rows = []
+        self.local.upsert_rows('shifts', rows)
+        if updated_since is None and not cached:
+            self.local.mark_range_cached('shifts', start_date_str, end_date_str)
+        return self.local._fetch_shift_rows(start_date_str, end_date_str, updated_since)
+
+    def get_shift_version(self):
+        return self.remote.get_shift_version()
+
+    def _fetch_help_rows(self, start_date_str, end_date_str):
+        try:
+            rows = self.remote._fetch_help_rows(start_date_str, end_date_str)
+        except Exception as e:
+            if not self.local.is_range_cached('store_help_requests', start_date_str, end_date_str):
+                raise
+            logger.warning("Supabase unavailable, serving %s - %s from the local cache: %s", start_date_str, end_date_str, e)
+            st.warning(f"Supabaseに接続できません。ローカルキャッシュのデータを表示しています: {e}")
+            return self.local._fetch_help_rows(start_date_str, end_date_str)
+        self.local.upsert_rows('store_help_requests', rows)
+        self.local.mark_range_cached('store_help_requests', start_date_str, end_date_str)
+        return rows
+
+    def _upsert_in_chunks(self, table, rows, records):
+        failed = self.remote._upsert_in_chunks(table, rows, records)
+        failed_keys = {(record[0].strftime('%Y-%m-%d'), record[1]) for record in failed}
+        key_column = TABLE_COLUMNS[table][0]
+        saved_rows = [row for row in rows if (row['date'], row[key_column]) not in failed_keys]
+        # updated_atはSupabase側で採番されるため空のまま保存し、次回の差分取得で正しい値に置き換える
+        self.local.upsert_rows(table, saved_rows)
+        return failed
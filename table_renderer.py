@@ -0,0 +1,105 @@
+import functools
+from html import escape
+import numpy as np
+import pandas as pd
+from constants import STORE_COLORS, SATURDAY_BG_COLOR, HOLIDAY_BG_COLOR, KANOYA_BG_COLOR, KAGOKITA_BG_COLOR, RECRUIT_BG_COLOR
+from shift_record import ShiftRecord, EMPTY_SHIFT
+
+# 店舗ごとの文字色のクラス（日本語の店舗名はクラス名に使えないため番号で表す）
+STORE_CLASSES = {store: f'store-{i}' for i, store in enumerate(STORE_COLORS)}
+# 時間帯のないシフト種類ごとの背景色のクラス
+SHIFT_TYPE_CLASSES = {
+    '休み': 'shift-off',
+    '鹿屋': 'shift-kanoya',
+    'かご北': 'shift-kagokita',
+    'リクルート': 'shift-recruit',
+}
+OTHER_SHIFT_CLASS = 'shift-other'
+# かご北の店舗の担当は、文字色ではなくかご北のシフトと同じ背景色で表す
+KAGOKITA_STORE_CLASS = SHIFT_TYPE_CLASSES['かご北']
+# 土曜日・日曜祝日の行のクラス
+SATURDAY_ROW_CLASS = 'row-saturday'
+HOLIDAY_ROW_CLASS = 'row-holiday'
+
+# シフト表のクラスのスタイル（ページに1回だけ出力する）
+SHIFT_TABLE_CSS = '\n'.join(
+    [f'.shift-table .{STORE_CLASSES[store]} {{ color: {color}; }}' for store, color in STORE_COLORS.items()]
+    + [
+        f'.shift-table .shift-off {{ background-color: {HOLIDAY_BG_COLOR}; }}',
+        f'.shift-table .shift-kanoya {{ background-color: {KANOYA_BG_COLOR}; }}',
+        f'.shift-table .shift-kagokita {{ background-color: {KAGOKITA_BG_COLOR}; }}',
+        f'.shift-table .shift-recruit, .shift-table .{OTHER_SHIFT_CLASS} {{ background-color: {RECRUIT_BG_COLOR}; }}',
+        f'.shift-table tr.{SATURDAY_ROW_CLASS} td {{ background-color: {SATURDAY_BG_COLOR}; }}',
+        f'.shift-table tr.{HOLIDAY_ROW_CLASS} td {{ background-color: {HOLIDAY_BG_COLOR}; }}',
+    ]
+)
+
+_TABLE_TEMPLATE = '<table class="shift-table"><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>'
+_ROW_CLASS_ATTRIBUTES = np.array(['', f' class="{SATURDAY_ROW_CLASS}"', f' class="{HOLIDAY_ROW_CLASS}"'], dtype=object)
+
+
+@functools.lru_cache(maxsize=None)
+def _row_template(columns):
+    """日付・曜日とcolumns人分のセルを持つ行のテンプレート（列数ごとに1回だけ作る）"""
+    return '<tr{}><td>{}</td><td>{}</td>' + '<td>{}</td>' * columns + '</tr>'
+
+
+def _segment_html(segment, in_other=False):
+    if not segment.store:
+        return escape(segment.time)
+    text = escape(f'{segment.time}@{segment.store}')
+    # 「その他」の中のかご北は、ほかの店舗と同じく文字色で表す
+    css_class = KAGOKITA_STORE_CLASS if segment.store == 'かご北' and not in_other else STORE_CLASSES.get(segment.store)
+    return f'<span class="{css_class}">{text}</span>' if css_class else text
+
+
+def shift_cell_html(shift):
+    """1セルのシフトを表示用のHTMLにする（utils.format_shiftsと同じ表示をクラスで表す）"""
+    record = ShiftRecord.of(shift)
+    if record.is_empty:
+        return '-'
+    if not record.segments and record.type in SHIFT_TYPE_CLASSES:
+        return f'<div class="{SHIFT_TYPE_CLASSES[record.type]}">{escape(record.type)}</div>'
+    if record.type == 'その他' and record.note is not None:
+        segments = '\n'.join(_segment_html(segment, in_other=True) for segment in record.segments)
+        return f'<div class="{OTHER_SHIFT_CLASS}">その他: {escape(record.note)}\n{segments}</div>'
+
+    segments = '\n'.join(_segment_html(segment) for segment in record.segments)
+    if record.type in ['AM可', 'PM可', '1日可']:
+        return f'<div>{record.type}\n{segments}</div>' if segments else record.type
+    return f'<div>{segments}</div>' if segments else '-'
+
+
+def render_shift_table(period, shift_data, employees, start=None, stop=None):
+    """期間の日付（start:stopの範囲）×従業員のシフト表をHTMLにする
+
+    同じシフトはまとめて1回だけHTMLにし、行は列数ごとに作った文字列のテンプレートに
+    埋め込む。色はセルごとのstyle属性ではなくクラスで付けるため、SHIFT_TABLE_CSSを
+    同じページに出力しておくこと。
+
+    Args:
+        period (PayPeriod): 表示する期間
+        shift_data (pd.DataFrame): 日付×従業員のシフト（文字列またはShiftRecord）
+        employees (list): 表示する従業員（列の順）
+        start, stop (int): 表示する日付の範囲（期間内の位置）
+    """
+    rows = slice(start, stop)
+    dates = period.dates[rows]
+    cells = shift_data.reindex(index=dates, columns=employees, fill_value=EMPTY_SHIFT).to_numpy(dtype=object)
+
+    # 同じシフトは1回だけHTMLにする（欠損のセル（-1）は末尾の '-' を引く）
+    codes, uniques = pd.factorize(cells.ravel())
+    unique_html = np.array([shift_cell_html(shift) for shift in uniques] + ['-'], dtype=object)
+    cell_html = unique_html[codes].reshape(cells.shape)
+
+    holiday = (period.is_sunday | period.is_holiday)[rows]
+    row_classes = _ROW_CLASS_ATTRIBUTES[np.where(holiday, 2, period.is_saturday[rows].astype(int))]
+    row_template = _row_template(len(employees))
+    body = ''.join(
+        row_template.format(row_class, date, weekday, *row)
+        for row_class, date, weekday, row in zip(
+            row_classes, dates.strftime('%Y-%m-%d'), period.weekdays[rows], cell_html.tolist()
+        )
+    )
+    header = ''.join(f'<th>{escape(column)}</th>' for column in ['日付', '曜日'] + list(employees))
+    return _TABLE_TEMPLATE.format(header=header, rows=body)
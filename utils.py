@@ -1,150 +1,171 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
-import jpholiday
-from constants import AREAS, SHIFT_TYPES, STORE_COLORS, FILLED_HELP_BG_COLOR, SATURDAY_BG_COLOR,HOLIDAY_BG_COLOR, KANOYA_BG_COLOR, KAGOKITA_BG_COLOR,RECRUIT_BG_COLOR
+from shift_record import ShiftRecord, EMPTY_SHIFT
+from assignment_index import StoreAssignmentIndex
+from shift_counts import ShiftTypeCodes
+from conflicts import ConflictDetector
+from help_gaps import analyze_help_gaps, coverage_status, COVERAGE_FULL, COVERAGE_PARTIAL, COVERAGE_NONE
+from constants import AREAS, SHIFT_TYPES, STORE_COLORS, FILLED_HELP_BG_COLOR, PARTIAL_HELP_BG_COLOR, SATURDAY_BG_COLOR,HOLIDAY_BG_COLOR, KANOYA_BG_COLOR, KAGOKITA_BG_COLOR,RECRUIT_BG_COLOR
 
 #シフト文字列を解析し、シフトタイプ、時間、店舗に分割
 def parse_shift(shift_str):
     """シフト文字列を解析し、シフトタイプ、時間、店舗に分割"""
     # 特殊なケースの処理
-    if pd.isna(shift_str) or shift_str in ['-', '休み', '鹿屋', 'かご北', 'リクルート'] or isinstance(shift_str, (int, float)):
+    if pd.isna(shift_str) or isinstance(shift_str, (int, float)):
         return shift_str, [], []
-
-    # 「その他」の場合の処理
-    if isinstance(shift_str, str) and shift_str.startswith('その他'):
-        parts = shift_str.split(',')
-        if len(parts) == 1:  # 「その他」のみの場合
-            return 'その他', [], []
-        elif len(parts) == 2:  # 内容のみの場合（例：その他,研修）
-            return 'その他', [parts[1]], []
-        else:  # 内容と時間/店舗情報がある場合
-            times = []
-            stores = []
-            # その他の内容は別途保持
-            other_content = parts[1]
-            # 3番目以降の要素を時間と店舗として処理
-            for part in parts[2:]:
-                if '@' in part:
-                    time, store = part.strip().split('@')
-                    times.append(time)
-                    stores.append(store)
-                else:
-                    times.append(part.strip())
-                    stores.append('')
-            # その他の内容を最初の要素として返す
-            return 'その他', [other_content] + times, stores
-
-    try:
-        # 通常のシフト処理
-        parts = str(shift_str).split(',')
-        shift_type = parts[0] if parts[0] in ['AM可', 'PM可', '1日可', '休み', '鹿屋', 'かご北', 'リクルート', 'その他'] else ''
-        
-        times_stores = []
-        for part in parts[1:]:
-            if '@' in part:
-                time, store = part.strip().split('@')
-                times_stores.append((time, store))
-            else:
-                times_stores.append((part.strip(), ''))
-        
-        times, stores = zip(*times_stores) if times_stores else ([], [])
-        return shift_type, list(times), list(stores)
-    except:
-        return '-', [], []
+    return ShiftRecord.of(shift_str).as_tuple()
     
 
 #シフトデータを表示用にフォーマット
+def format_segment(segment):
+    if not segment.store:
+        return segment.time
+    if segment.store == 'かご北':
+        # かご北の場合は背景色を適用
+        return f'<span style="background-color: {KAGOKITA_BG_COLOR}">{segment.time}@{segment.store}</span>'
+    # その他の店舗は通常の色のみ
+    color = STORE_COLORS.get(segment.store, "#000000")
+    return f'<span style="color: {color}">{segment.time}@{segment.store}</span>'
+
 def format_shifts(val):
-    if pd.isna(val) or val == '-' or isinstance(val, (int, float)):
-        return val
-    if val == '休み':
-        return f'<div style="background-color: {HOLIDAY_BG_COLOR};">{val}</div>'
-    if val == '鹿屋':
-        return f'<div style="background-color: {KANOYA_BG_COLOR};">{val}</div>'
-    if val == 'かご北':
-        return f'<div style="background-color: {KAGOKITA_BG_COLOR};">{val}</div>'
-    if val == 'リクルート':
-        return f'<div style="background-color: {RECRUIT_BG_COLOR};">{val}</div>'
-    if isinstance(val, str) and val.startswith('その他'):
-        parts = val.split(',')
-        if len(parts) > 1:
-            # その他の内容を取得
-            content = parts[1]
-            # 時間と店舗の情報を処理
-            shift_parts = []
-            for part in parts[2:]:
-                if '@' in part:
-                    time, store = part.strip().split('@')
-                    color = STORE_COLORS.get(store, "#000000")
-                    shift_parts.append(f'<span style="color: {color}">{time}@{store}</span>')
-                else:
-                    shift_parts.append(part.strip())
-            
-            # その他の内容と時間/店舗情報を改行で区切って表示
-            shifts_str = chr(10).join(shift_parts) if shift_parts else ''
-            return f'<div style="background-color: {RECRUIT_BG_COLOR}; white-space: pre-line">その他: {content}\n{shifts_str}</div>'
-        return f'<div style="background-color: {RECRUIT_BG_COLOR};">その他: {parts[1]}</div>'
+    record = ShiftRecord.of(val)
+    if record.is_empty:
+        return '-'
+    if not record.segments:
+        if record.type == '休み':
+            return f'<div style="background-color: {HOLIDAY_BG_COLOR};">{record.type}</div>'
+        if record.type == '鹿屋':
+            return f'<div style="background-color: {KANOYA_BG_COLOR};">{record.type}</div>'
+        if record.type == 'かご北':
+            return f'<div style="background-color: {KAGOKITA_BG_COLOR};">{record.type}</div>'
+        if record.type == 'リクルート':
+            return f'<div style="background-color: {RECRUIT_BG_COLOR};">{record.type}</div>'
+    if record.type == 'その他' and record.note is not None:
+        # その他の内容と時間/店舗情報を改行で区切って表示
+        shift_parts = [
+            f'<span style="color: {STORE_COLORS.get(segment.store, "#000000")}">{segment.time}@{segment.store}</span>'
+            if segment.store else segment.time
+            for segment in record.segments
+        ]
+        shifts_str = chr(10).join(shift_parts)
+        return f'<div style="background-color: {RECRUIT_BG_COLOR}; white-space: pre-line">その他: {record.note}\n{shifts_str}</div>'
     
-    try:
-        parts = str(val).split(',')
-        shift_type = parts[0]
-        formatted_shifts = []
-        
-        for part in parts[1:]:
-            if '@' in part:
-                time, store = part.strip().split('@')
-                if store == 'かご北':
-                    # かご北の場合は背景色を適用
-                    formatted_shifts.append(f'<span style="background-color: {KAGOKITA_BG_COLOR}">{time}@{store}</span>')
-                else:
-                    # その他の店舗は通常の色のみ
-                    color = STORE_COLORS.get(store, "#000000")
-                    formatted_shifts.append(f'<span style="color: {color}">{time}@{store}</span>')
-            else:
-                formatted_shifts.append(part.strip())
-        
-        if shift_type in ['AM可', 'PM可', '1日可']:
-            if formatted_shifts:
-                return f'<div style="white-space: pre-line">{shift_type}\n{chr(10).join(formatted_shifts)}</div>'
-            else:
-                return shift_type
-        else:
-            return f'<div style="white-space: pre-line">{chr(10).join(formatted_shifts)}</div>' if formatted_shifts else '-'
-    except Exception as e:
-        print(f"Error formatting shift: {val}. Error: {e}")
-        return str(val)
+    formatted_shifts = [format_segment(segment) for segment in record.segments]
+    if record.type in ['AM可', 'PM可', '1日可']:
+        if formatted_shifts:
+            return f'<div style="white-space: pre-line">{record.type}\n{chr(10).join(formatted_shifts)}</div>'
+        return record.type
+    return f'<div style="white-space: pre-line">{chr(10).join(formatted_shifts)}</div>' if formatted_shifts else '-'
     
-#セッション状態のシフトデータを更新
+# 取得したシフトとの差分がこの件数以下なら、逆引きインデックスとコードをセル単位で更新する（多ければ作り直す）
+INCREMENTAL_UPDATE_LIMIT = 32
+
+#セッション状態のシフトデータを取得したシフトでまとめて更新
 def update_session_state_shifts(shifts):
-    for date, row in shifts.iterrows():
-        if date in st.session_state.shift_data.index:
-            for employee, shift in row.items():
-                if pd.notna(shift):
-                    # 変更後 - DataFrameのデータ型を文字列に事前に変換する
-                    if isinstance(st.session_state.shift_data, pd.DataFrame):
-                        if st.session_state.shift_data.dtypes[employee] != 'object':
-                            st.session_state.shift_data[employee] = st.session_state.shift_data[employee].astype('object')
-                    st.session_state.shift_data.loc[date, employee] = str(shift)
-                else:
-                    st.session_state.shift_data.loc[date, employee] = '-'
-
-#土曜日と日曜日の行に背景色を適用
-def is_holiday(date):
-    return jpholiday.is_holiday(date)
-
-def highlight_weekend_and_holiday(row):
-    weekday = row['曜日']
-    date = pd.to_datetime(row['日付'])
-    if weekday == '日' or is_holiday(date):
-        return ['background-color: ' + HOLIDAY_BG_COLOR] * len(row)
-    elif weekday == '土':
-        return ['background-color: ' + SATURDAY_BG_COLOR] * len(row)
-    return [''] * len(row)
+    # 前回マージしたときから取得結果のバージョンが変わっていなければ何もしない
+    version = shifts.attrs.get('version')
+    if version is not None and version == st.session_state.get('merged_shifts_version'):
+        return
+
+    shift_data = st.session_state.shift_data
+    dates = shift_data.index.intersection(shifts.index) if not shifts.empty else shift_data.index[:0]
+    if len(dates):
+        # 新しい従業員の列を追加し、型をobjectにそろえる
+        new_columns = shifts.columns.difference(shift_data.columns, sort=False)
+        if len(new_columns):
+            shift_data = shift_data.reindex(columns=shift_data.columns.append(new_columns), fill_value=EMPTY_SHIFT)
+        if (shift_data.dtypes != object).any():
+            shift_data = shift_data.astype(object)
+
+        # 取得時に解析済みのShiftRecordをそのまま保持する（欠損は未入力として扱う）
+        fetched = shifts.loc[dates]
+        fetched = fetched.where(fetched.notna(), EMPTY_SHIFT)
+        changed = shift_data.loc[dates, fetched.columns].to_numpy() != fetched.to_numpy()
+        if changed.any():
+            shift_data.loc[dates, fetched.columns] = fetched
+        if changed.any() or len(new_columns):
+            bump_shift_data_version()
+        st.session_state.shift_data = shift_data
+
+        rows, columns = np.nonzero(changed)
+        if len(rows) > INCREMENTAL_UPDATE_LIMIT:
+            # 次に使うときにシフトから作り直す
+            st.session_state.pop('assignment_index', None)
+            st.session_state.pop('shift_type_codes', None)
+            st.session_state.pop('conflict_detector', None)
+        else:
+            for row, column in zip(rows, columns):
+                update_shift_indexes(dates[row], fetched.columns[column], fetched.iat[row, column])
+
+    st.session_state.merged_shifts_version = version
+
+#セッション状態のシフトを1セル更新し、店舗の逆引きインデックスとシフト種類のコードにも反映
+def set_session_shift(date, employee, shift):
+    record = ShiftRecord.of(shift)
+    current = st.session_state.shift_data.at[date, employee] if employee in st.session_state.shift_data.columns else None
+    if current == record:
+        return
+    st.session_state.shift_data.loc[date, employee] = record
+    bump_shift_data_version()
+    update_shift_indexes(date, employee, record)
+
+#セッション状態のシフトの内容が変わったことを記録する（描画済みのHTMLのキャッシュキーに使う）
+#期間を切り替えても値を戻さないため、同じバージョンが別の内容を指すことはない
+def bump_shift_data_version():
+    st.session_state.shift_data_version = st.session_state.get('shift_data_version', 0) + 1
+
+#セルの変更を、セッション状態のシフトから作ったインデックス（逆引き・シフト種類のコード・衝突検出）に反映
+def update_shift_indexes(date, employee, record):
+    get_assignment_index().update(date, employee, record)
+    get_conflict_detector().update(date, employee, record)
+    shift_type_codes = st.session_state.get('shift_type_codes')
+    if shift_type_codes is not None:
+        if shift_type_codes.contains(date, employee):
+            shift_type_codes.update(date, employee, record)
+        else:
+            # 従業員の列が増えた場合は、次に使うときにシフトから作り直す
+            del st.session_state.shift_type_codes
+
+#セッション状態のシフトに対応する店舗の逆引きインデックスを取得（未作成ならシフトから作成）
+def get_assignment_index():
+    if 'assignment_index' not in st.session_state:
+        st.session_state.assignment_index = StoreAssignmentIndex.from_shift_data(st.session_state.shift_data)
+    return st.session_state.assignment_index
+
+#セッション状態のシフトに対応する衝突検出を取得（未作成ならシフトから期間全体を検査して作成）
+def get_conflict_detector():
+    if 'conflict_detector' not in st.session_state:
+        st.session_state.conflict_detector = ConflictDetector.from_shift_data(st.session_state.shift_data)
+    return st.session_state.conflict_detector
 
+#セッション状態のシフトに対応するシフト種類のコードを取得（未作成ならシフトから作成）
+def get_shift_type_codes():
+    shift_type_codes = st.session_state.get('shift_type_codes')
+    if shift_type_codes is None or not shift_type_codes.matches(st.session_state.shift_data):
+        shift_type_codes = ShiftTypeCodes.from_shift_data(st.session_state.shift_data)
+        st.session_state.shift_type_codes = shift_type_codes
+    return shift_type_codes
+
+#土曜日と日曜日・祝日の背景色を期間の日付ごとに求める
+def weekend_and_holiday_css(period, dates=None):
+    positions = slice(None) if dates is None else period.positions(dates)
+    holiday = (period.is_sunday | period.is_holiday)[positions]
+    saturday = period.is_saturday[positions]
+    return np.where(holiday, 'background-color: ' + HOLIDAY_BG_COLOR,
+                    np.where(saturday, 'background-color: ' + SATURDAY_BG_COLOR, ''))
+
+#土曜日と日曜日の行に背景色を適用（Styler.apply(axis=None)用、row_cssは行ごとのCSS）
+def highlight_weekend_and_holiday(data, row_css):
+    return pd.DataFrame(np.repeat(np.asarray(row_css)[:, None], data.shape[1], axis=1),
+                        index=data.index, columns=data.columns)
+
+
+# すべての店舗を1つのリストにフラット化
+ALL_STORES = [store for stores in AREAS.values() for store in stores]
 
 def get_store_index(store):
-    all_stores = [s for stores in AREAS.values() for s in stores]
-    return all_stores.index(store) if store in all_stores else 0
+    return ALL_STORES.index(store) if store in ALL_STORES else 0
 
 def get_shift_type_index(shift_type):
     return SHIFT_TYPES.index(shift_type) if shift_type in SHIFT_TYPES else 0
@@ -152,23 +173,55 @@ def get_shift_type_index(shift_type):
 
 #シフトが埋まっているかどうかをチェック
 def is_shift_filled(shift):
-    if pd.isna(shift) or shift == '-':
-        return False, []
-    shift_type, times, stores = parse_shift(shift)
-    return bool(times and stores), stores
-
-
-#埋まっているシフトをハイライト
-def highlight_filled_shifts(row, shift_data):
-    styles = [''] * len(row)
-    date = pd.to_datetime(row['日付'])
-    if date not in shift_data.index:
-        return styles
-    
-    all_stores = [store for stores in AREAS.values() for store in stores]
-    for i, store in enumerate(all_stores):
-        if store in row.index:
-            store_shifts = shift_data.loc[date]
-            if any(is_shift_filled(shift)[0] and store in is_shift_filled(shift)[1] for shift in store_shifts if pd.notna(shift)):
-                styles[row.index.get_loc(store)] = FILLED_HELP_BG_COLOR
-    return styles
\ No newline at end of file
+    record = ShiftRecord.of(shift)
+    return record.is_filled, record.stores
+
+
+#店舗ヘルプ希望の充足状況（日付×店舗）を期間分まとめて計算
+def compute_help_coverage(store_help_requests, assignment_index, stores=ALL_STORES, gaps=None):
+    """
+    希望時間帯と、ヘルプに入る従業員の時間帯を分単位で比較して充足状況を求める
+
+    - 希望時間帯を解析できるセルは、help_gaps.coverage_status() と同じ規則で決める
+      （覆っている分数で full / partial / 空。時間を解析できない担当がいれば full）
+    - 希望時間帯を解析できない場合は、誰かが入っていれば full とする
+
+    Args:
+        store_help_requests (pd.DataFrame): 日付×店舗の希望時間帯
+        assignment_index (StoreAssignmentIndex): (日付, 店舗) の逆引きインデックス
+        stores (list): 対象の店舗
+        gaps (pd.DataFrame): 同じ希望・店舗で計算済みの analyze_help_gaps() の結果（省略時は計算する）
+
+    Returns:
+        pd.DataFrame: 日付×店舗の充足状況
+    """
+    dates = pd.DatetimeIndex(store_help_requests.index)
+    store_positions = {store: i for i, store in enumerate(stores)}
+    date_positions = {date: i for i, date in enumerate(dates)}
+
+    # 誰かが入っているセルは、ひとまず full とする（希望時間帯を解析できないセルはこのまま）
+    coverage = np.full((len(dates), len(stores)), COVERAGE_NONE, dtype=object)
+    for date, store, _, _ in assignment_index.iter_segments(dates):
+        if store in store_positions:
+            coverage[date_positions[date], store_positions[store]] = COVERAGE_FULL
+
+    # 希望時間帯を解析できるセルは、覆っている分数から決める
+    if gaps is None:
+        gaps = analyze_help_gaps(store_help_requests, assignment_index, stores)
+    if not gaps.empty:
+        rows = dates.get_indexer(pd.DatetimeIndex(gaps['date']))
+        columns = np.array([store_positions[store] for store in gaps['store']])
+        coverage[rows, columns] = coverage_status(gaps)
+    return pd.DataFrame(coverage, index=dates, columns=stores)
+
+
+#ヘルプ希望の表に充足状況の背景色を付ける（Styler.apply(axis=None)用）
+def highlight_help_coverage(data, coverage):
+    css = np.select(
+        [coverage.to_numpy() == COVERAGE_FULL, coverage.to_numpy() == COVERAGE_PARTIAL],
+        [FILLED_HELP_BG_COLOR, PARTIAL_HELP_BG_COLOR],
+        default=''
+    )
+    styles = pd.DataFrame('', index=data.index, columns=data.columns)
+    styles[list(coverage.columns)] = css
+    return styles
@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+import pandas as pd
+import streamlit as st
+from database import get_db
+from shift_record import ShiftRecord
+
+logger = logging.getLogger(__name__)
+
+# 書き込みをまとめて保存する間隔（秒）
+FLUSH_INTERVAL = 0.5
+# 保存に失敗した場合の再試行回数と、再試行までの待ち時間の初期値（秒、回数ごとに倍になる）
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+SHIFTS = 'shifts'
+STORE_HELP_REQUESTS = 'store_help_requests'
+
+
+class WriteBehindQueue:
+    """シフトと店舗ヘルプ希望の書き込みを溜めて、バックグラウンドでまとめて保存するキュー
+
+    同じキー（日付と従業員、または日付と店舗）への書き込みは最新の値にまとめ、
+    一定間隔ごとにテーブル単位の一括Upsertで保存する。失敗した行は待ち時間を
+    倍にしながら再試行し、MAX_RETRIES回失敗したものは失敗として残す。
+    """
+
+    def __init__(self, db, flush_interval=FLUSH_INTERVAL, max_retries=MAX_RETRIES):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # (テーブル, 日付文字列, 従業員または店舗) -> {'record', 'attempts', 'next_try'}
+        self._pending = {}
+        self._failed = {}
+        # 保存に失敗した書き込みの通し番号（セッションごとに、まだ反映していない失敗を見分けるのに使う）
+        self._failure_seq = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name='write-behind-queue')
+        self._thread.start()
+
+    def enqueue_shifts(self, shifts):
+        """(日付, 従業員, シフト文字列) のリストを保存待ちに積む"""
+        self._enqueue(SHIFTS, shifts)
+
+    def enqueue_store_help_requests(self, help_requests):
+        """(日付, 店舗, 時間帯) のリストを保存待ちに積む"""
+        self._enqueue(STORE_HELP_REQUESTS, help_requests)
+
+    def _enqueue(self, table, records):
+        with self._lock:
+            for record in records:
+                key = (table, record[0].strftime('%Y-%m-%d'), record[1])
+                # 同じキーへの書き込みは最新の値だけを残す
+                self._pending[key] = {'record': record, 'attempts': 0, 'next_try': 0}
+                self._failed.pop(key, None)
+        self._wakeup.set()
+
+    def stats(self):
+        """保存待ちと保存失敗の件数を返す"""
+        with self._lock:
+            return {'pending': len(self._pending), 'failed': len(self._failed)}
+
+    def retry_failed(self):
+        """保存に失敗した書き込みを保存待ちに戻す"""
+        with self._lock:
+            for key, item in self._failed.items():
+                self._pending.setdefault(key, {'record': item['record'], 'attempts': 0, 'next_try': 0})
+            self._failed.clear()
+        self._wakeup.set()
+
+    def failed_since(self, table, seq):
+        """通し番号seqより後に保存に失敗した (日付, キー, 値) のリストと、最新の通し番号を返す"""
+        with self._lock:
+            records = [item['record'] for key, item in self._failed.items() if key[0] == table and item['failure_seq'] > seq]
+            return records, self._failure_seq
+
+    def failed_records(self, table):
+        """保存に失敗したままの (日付, キー, 値) のリストを返す"""
+        with self._lock:
+            return [item['record'] for key, item in self._failed.items() if key[0] == table]
+
+    def status(self, table, records):
+        """書き込んだ (日付, キー, 値) ごとに、'pending'（保存待ち）・'failed'（保存失敗）・'saved'（保存済み）を返す
+
+        同じキーにその後別の値が書き込まれた場合は、その書き込みの状態を返す。
+        """
+        statuses = []
+        with self._lock:
+            for record in records:
+                key = (table, record[0].strftime('%Y-%m-%d'), record[1])
+                statuses.append('pending' if key in self._pending else 'failed' if key in self._failed else 'saved')
+        return statuses
+
+    def pending_records(self, table):
+        """保存待ちの (日付, キー, 値) のリストを返す（画面への楽観的な反映用）"""
+        with self._lock:
+            return [item['record'] for key, item in self._pending.items() if key[0] == table]
+
+    def overlay(self, frame, table, start_date, end_date):
+        """期間内の保存待ちの値をピボット（日付×従業員／店舗）に上書きする"""
+        records = [
+            (pd.Timestamp(date), column, value)
+            for date, column, value in self.pending_records(table)
+            if start_date <= pd.Timestamp(date) <= end_date
+        ]
+        if not records:
+            return frame
+        for date, column, value in records:
+            if table == SHIFTS:
+                value = ShiftRecord.parse(value)
+            if column not in frame.columns:
+                frame[column] = pd.Series('-', index=frame.index, dtype=object)
+            frame.loc[date, column] = value
+        frame.index = pd.to_datetime(frame.index)
+        return frame.sort_index()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            # 連続した書き込みをまとめるため、起こされた後も一定時間待ってから保存する
+            time.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("Write-behind flush failed: %s", e)
+
+    def flush(self):
+        """保存時刻になった書き込みをテーブルごとに一括で保存する"""
+        now = time.time()
+        with self._lock:
+            ready = {key: item for key, item in self._pending.items() if item['next_try'] <= now}
+
+        for table, save in ((SHIFTS, self.db.save_shifts_bulk), (STORE_HELP_REQUESTS, self.db.save_store_help_requests_bulk)):
+            batch = {key: item for key, item in ready.items() if key[0] == table}
+            if not batch:
+                continue
+            try:
+                failed = save([item['record'] for item in batch.values()])
+            except Exception as e:
+                logger.exception("Write-behind save failed on %s: %s", table, e)
+                failed = [item['record'] for item in batch.values()]
+            failed_keys = {(table, record[0].strftime('%Y-%m-%d'), record[1]) for record in failed}
+            self._acknowledge(batch, failed_keys)
+
+    def _acknowledge(self, batch, failed_keys):
+        with self._lock:
+            for key, item in batch.items():
+                # 保存中に同じキーへ新しい書き込みがあった場合は、そちらを次回保存する
+                if self._pending.get(key) is not item:
+                    continue
+                if key not in failed_keys:
+                    del self._pending[key]
+                    continue
+                item['attempts'] += 1
+                if item['attempts'] >= self.max_retries:
+                    self._failure_seq += 1
+                    item['failure_seq'] = self._failure_seq
+                    self._failed[key] = self._pending.pop(key)
+                else:
+                    delay = min(RETRY_BASE_DELAY * 2 ** (item['attempts'] - 1), RETRY_MAX_DELAY)
+                    item['next_try'] = time.time() + delay
+
+
+@st.cache_resource
+def get_write_queue():
+    """プロセスで共有する書き込みキューを返す"""
+    return WriteBehindQueue(get_db())